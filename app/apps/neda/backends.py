@@ -0,0 +1,368 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+from fastapi_mongo_base.tasks import TaskStatusEnum
+from server.config import Settings
+from utils import rvc
+
+
+class BackendUnavailable(Exception):
+    pass
+
+
+class InferenceBackend:
+    """
+    An RVC inference provider, with the health and load figures the router
+    needs to choose between providers.
+    """
+
+    name: str
+    # webhook route suffix, so callbacks are parsed with the right schema
+    provider: str | None = None
+    health_ttl = 15
+
+    def __init__(self, name: str, cost_per_minute: float, max_queue: int):
+        self.name = name
+        self.cost_per_minute = cost_per_minute
+        self.max_queue = max_queue
+
+        self.healthy = True
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.queue_depth = 0
+        self.workers = 1
+        self.health_checked_at = 0.0
+        # exponentially weighted moving average of the job latency in seconds
+        self.latency = Settings.backend_default_latency
+
+        self.dispatched = 0
+        self.completed = 0
+        self.failed = 0
+        self.completions: deque[float] = deque(maxlen=1000)
+        # model slug -> last time a job for it was sent to this backend, most
+        # recent last; a backend keeps about one model warm per worker
+        self.warm_models: OrderedDict[str, float] = OrderedDict()
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    @property
+    def saturated(self) -> bool:
+        return self.queue_depth >= self.max_queue
+
+    def is_warm(self, model_slug: str | None) -> bool:
+        served_at = self.warm_models.get(model_slug)
+        return (
+            served_at is not None
+            and time.monotonic() - served_at < Settings.model_warm_ttl
+        )
+
+    def mark_warm(self, model_slug: str | None):
+        if model_slug is None:
+            return
+        self.warm_models[model_slug] = time.monotonic()
+        self.warm_models.move_to_end(model_slug)
+        while len(self.warm_models) > max(self.workers, 1):
+            self.warm_models.popitem(last=False)
+
+    def score(self, duration: float = 60, model_slug: str | None = None) -> float:
+        """Expected seconds until the result, plus the weighted cost."""
+        wait = self.latency * (1 + self.queue_depth / max(self.workers, 1))
+        if model_slug and not self.is_warm(model_slug):
+            wait += Settings.model_cold_start
+        cost = self.cost_per_minute * duration / 60
+        return wait + Settings.backend_cost_weight * cost
+
+    async def refresh(self):
+        pass
+
+    async def submit(
+        self, audio: str, model_url: str, pitch: float, webhook_url: str
+    ) -> str:
+        raise NotImplementedError
+
+    async def status(self, run_id: str) -> dict | None:
+        """
+        The finished job as a webhook payload for this provider, or None while
+        it is still running. Used to collect results whose webhook was lost.
+        """
+        return None
+
+    def dequeue(self):
+        self.queue_depth = max(self.queue_depth - 1, 0)
+
+    def record_success(self, latency: float | None = None):
+        self.completed += 1
+        self.completions.append(time.monotonic())
+        self.failures = 0
+        self.healthy = True
+        if latency is not None:
+            self.latency = 0.8 * self.latency + 0.2 * latency
+
+    def record_failure(self):
+        self.failed += 1
+        self.failures += 1
+        # a single failed job is often the job, not the backend
+        strikes = self.failures - Settings.backend_failure_threshold
+        if strikes < 0:
+            return
+        self.healthy = False
+        self.cooldown_until = time.monotonic() + min(
+            Settings.backend_cooldown * 2**strikes, 600
+        )
+
+    def webhook_url(
+        self, webhook_url: str | None, dispatch_id: str | None = None
+    ) -> str | None:
+        if webhook_url and self.provider:
+            webhook_url = f"{webhook_url}/{self.provider}"
+        if webhook_url and dispatch_id:
+            # tells the callback of this attempt apart from earlier ones
+            webhook_url = f"{webhook_url}?dispatch={dispatch_id}"
+        return webhook_url
+
+    def throughput(self, window: float = 300) -> float:
+        """Completed jobs per minute over the last `window` seconds."""
+        since = time.monotonic() - window
+        return sum(1 for t in self.completions if t >= since) * 60 / window
+
+    def metrics(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "available": self.available,
+            "saturated": self.saturated,
+            "queue_depth": self.queue_depth,
+            "workers": self.workers,
+            "latency": round(self.latency, 2),
+            "cost_per_minute": self.cost_per_minute,
+            "dispatched": self.dispatched,
+            "completed": self.completed,
+            "failed": self.failed,
+            "throughput_per_minute": round(self.throughput(), 2),
+            "warm_models": [slug for slug in self.warm_models if self.is_warm(slug)],
+        }
+
+
+class RunpodBackend(InferenceBackend):
+    provider = "runpod"
+
+    def __init__(self, runpod_id: str, **kwargs):
+        super().__init__(name=f"runpod:{runpod_id}", **kwargs)
+        self.runpod_id = runpod_id
+
+    async def refresh(self):
+        if time.monotonic() - self.health_checked_at < self.health_ttl:
+            return
+        self.health_checked_at = time.monotonic()
+        try:
+            health = await asyncio.to_thread(rvc.get_runpod_health, self.runpod_id)
+        except Exception as e:
+            # a slow /health says little about job submission, only stop
+            # trusting the reported load until the next check
+            logging.warning(f"RunPod health check failed {self.name} {e}")
+            self.healthy = False
+            return
+
+        self.healthy = True
+
+        jobs = health.get("jobs", {})
+        workers = health.get("workers", {})
+        self.queue_depth = jobs.get("inQueue", 0)
+        self.workers = max(workers.get("idle", 0) + workers.get("running", 0), 1)
+
+    async def submit(self, audio, model_url, pitch, webhook_url):
+        run_id = await asyncio.to_thread(
+            rvc.create_rvc_conversion_runpod,
+            audio,
+            model_url,
+            pitch,
+            webhook_url,
+            runpod_id=self.runpod_id,
+        )
+        if not run_id:
+            raise BackendUnavailable(f"{self.name} returned no job id")
+        return run_id
+
+    async def status(self, run_id: str) -> dict | None:
+        job = await asyncio.to_thread(
+            rvc.get_rvc_conversion_runpod_status, run_id, self.runpod_id
+        )
+        if job.get("status") == "COMPLETED":
+            output = job.get("output")
+            if isinstance(output, dict):
+                return {"output_url": output.get("output_url"), **output}
+            return {"output_url": output}
+        if job.get("status") in ("FAILED", "CANCELLED", "TIMED_OUT"):
+            return {"error": job.get("error") or job.get("status")}
+        return None
+
+
+class ReplicateBackend(InferenceBackend):
+    provider = "replicate"
+
+    def __init__(self, **kwargs):
+        super().__init__(name="replicate", **kwargs)
+
+    async def refresh(self):
+        """
+        Replicate reports no queue, count the jobs of every replica that are
+        still waiting for their result instead.
+        """
+        from .models import VoiceConvert
+        from .schemas import VoiceConvertStage
+
+        if time.monotonic() - self.health_checked_at < self.health_ttl:
+            return
+        self.health_checked_at = time.monotonic()
+        try:
+            self.queue_depth = await VoiceConvert.find(
+                {
+                    "backend": self.name,
+                    "stage": VoiceConvertStage.dispatched,
+                    "task_status": TaskStatusEnum.processing,
+                }
+            ).count()
+        except Exception as e:
+            logging.warning(f"Queue count failed {self.name} {e}")
+
+    async def submit(self, audio, model_url, pitch, webhook_url):
+        return await asyncio.to_thread(
+            rvc.create_rvc_conversion, audio, model_url, pitch, webhook_url
+        )
+
+    async def status(self, run_id: str) -> dict | None:
+        import replicate
+
+        prediction = await asyncio.to_thread(replicate.predictions.get, run_id)
+        if prediction.status not in ("succeeded", "failed", "canceled"):
+            return None
+        return prediction.dict()
+
+
+class BackendRouter:
+    def __init__(self, backends: list[InferenceBackend]):
+        self.backends = {backend.name: backend for backend in backends}
+        self.decisions: dict[str, int] = {}
+        self.failovers = 0
+        self.rejections = 0
+        self.warm_hits = 0
+
+    @classmethod
+    def from_env(cls):
+        backends: list[InferenceBackend] = []
+        runpod_ids = os.getenv("RUNPOD_IDS") or os.getenv("RUNPOD_ID") or ""
+        for runpod_id in filter(None, map(str.strip, runpod_ids.split(","))):
+            backends.append(
+                RunpodBackend(
+                    runpod_id,
+                    cost_per_minute=Settings.runpod_cost_per_minute,
+                    max_queue=Settings.backend_max_queue,
+                )
+            )
+        if os.getenv("REPLICATE_API_TOKEN"):
+            backends.append(
+                ReplicateBackend(
+                    cost_per_minute=Settings.replicate_cost_per_minute,
+                    max_queue=Settings.backend_max_queue,
+                )
+            )
+        return cls(backends)
+
+    def get(self, name: str | None) -> InferenceBackend | None:
+        return self.backends.get(name)
+
+    async def candidates(
+        self, duration: float = 60, model_slug: str | None = None
+    ) -> list[InferenceBackend]:
+        await asyncio.gather(*(backend.refresh() for backend in self.backends.values()))
+        ready = [
+            backend
+            for backend in self.backends.values()
+            if backend.available and not backend.saturated
+        ]
+        if not ready:
+            # everything is saturated or cooling down, fall back to the
+            # backends that are not cooling down rather than refusing the job
+            ready = [b for b in self.backends.values() if b.available]
+        if not ready and self.backends:
+            # all cooling down, try the one whose cooldown ends first
+            ready = [min(self.backends.values(), key=lambda b: b.cooldown_until)]
+        return sorted(ready, key=lambda backend: backend.score(duration, model_slug))
+
+    async def dispatch(
+        self,
+        audio: str,
+        model_url: str,
+        pitch: float,
+        webhook_url: str,
+        duration: float = 60,
+        model_slug: str | None = None,
+        dispatch_id: str | None = None,
+    ) -> tuple[InferenceBackend, str]:
+        candidates = await self.candidates(duration, model_slug)
+        for i, backend in enumerate(candidates):
+            try:
+                run_id = await backend.submit(
+                    audio,
+                    model_url,
+                    pitch,
+                    backend.webhook_url(webhook_url, dispatch_id),
+                )
+            except Exception as e:
+                logging.error(f"Backend dispatch failed {backend.name} {e}")
+                backend.record_failure()
+                continue
+
+            warm = backend.is_warm(model_slug)
+            backend.dispatched += 1
+            backend.queue_depth += 1
+            backend.mark_warm(model_slug)
+            self.decisions[backend.name] = self.decisions.get(backend.name, 0) + 1
+            self.failovers += i
+            self.warm_hits += warm
+            logging.info(
+                f"Routed job to {backend.name} model={model_slug} warm={warm} "
+                f"score={backend.score(duration, model_slug):.1f} skipped={i}"
+            )
+            return backend, run_id
+
+        self.rejections += 1
+        raise BackendUnavailable("No inference backend is available")
+
+    async def prewarm(self, model_slug: str, model_url: str, audio_url: str):
+        """Send a throwaway job so a backend loads the model before real traffic."""
+        if any(backend.is_warm(model_slug) for backend in self.backends.values()):
+            return
+        candidates = await self.candidates(model_slug=model_slug)
+        if not candidates:
+            return
+        backend = candidates[0]
+        try:
+            await backend.submit(audio_url, model_url, 0, None)
+        except Exception as e:
+            logging.warning(f"Prewarm failed {backend.name} {model_slug} {e}")
+            return
+        backend.mark_warm(model_slug)
+        # the throwaway job has no webhook, count it as queued for about as
+        # long as a job takes so routing sees the extra load
+        backend.queue_depth += 1
+        asyncio.get_running_loop().call_later(backend.latency, backend.dequeue)
+        logging.info(f"Prewarmed {model_slug} on {backend.name}")
+
+    def metrics(self) -> dict:
+        return {
+            "decisions": self.decisions,
+            "failovers": self.failovers,
+            "rejections": self.rejections,
+            "warm_hits": self.warm_hits,
+            "backends": {
+                name: backend.metrics() for name, backend in self.backends.items()
+            },
+        }
+
+
+backend_router = BackendRouter.from_env()
@@ -0,0 +1,129 @@
+import base64
+import binascii
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi_mongo_base.core import exceptions
+from fastapi_mongo_base.tasks import TaskStatusEnum
+from pymongo.errors import BulkWriteError
+from server.config import Settings
+
+from .models import VoiceConvert, VoiceConvertArchive
+from .schemas import VoiceConvertCursorPage, VoiceConvertListItemSchema
+
+
+def encode_cursor(item: VoiceConvertListItemSchema) -> str:
+    raw = json.dumps([item.created_at.isoformat(), str(item.uid)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, uid = json.loads(raw)
+        if not isinstance(created_at, str) or not isinstance(uid, str):
+            raise TypeError("cursor values must be strings")
+        return datetime.fromisoformat(created_at), uuid.UUID(uid)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise exceptions.BaseHTTPException(
+            status_code=400,
+            error="invalid_cursor",
+            message={"en": "Invalid cursor.", "fa": "مقدار cursor نامعتبر است."},
+        )
+
+
+async def list_history(
+    user_id: uuid.UUID,
+    cursor: str | None = None,
+    limit: int = 20,
+    archived: bool = False,
+) -> VoiceConvertCursorPage:
+    """
+    Page through a user's conversions newest first, seeking on
+    (user_id, created_at, uid) instead of skipping, and fetching only the
+    list fields.
+    """
+    model = VoiceConvertArchive if archived else VoiceConvert
+    query = {"user_id": user_id}
+    if not archived:
+        query["is_deleted"] = False
+    if cursor:
+        created_at, uid = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "uid": {"$lt": uid}},
+        ]
+
+    items = (
+        await model.find(query)
+        .sort([("created_at", -1), ("uid", -1)])
+        .limit(limit + 1)
+        .project(VoiceConvertListItemSchema)
+        .to_list()
+    )
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return VoiceConvertCursorPage(
+        items=items[:limit], next_cursor=next_cursor, limit=limit
+    )
+
+
+def to_archive(voice_task: VoiceConvert, archived_at: datetime) -> VoiceConvertArchive:
+    meta_data = voice_task.meta_data or {}
+    return VoiceConvertArchive(
+        **voice_task.model_dump(include=set(VoiceConvertListItemSchema.model_fields)),
+        user_id=voice_task.user_id,
+        tenant_id=voice_task.tenant_id,
+        duration=meta_data.get("duration"),
+        model_name=meta_data.get("model_name"),
+        archived_at=archived_at,
+    )
+
+
+async def archive_finished_tasks() -> int:
+    """
+    Move finished conversions older than `archive_after_days` into the
+    archive collection, a batch at a time. A task is only deleted from the
+    hot collection once its archive copy exists, so a crash between the two
+    steps is repaired by the next run.
+    """
+    if not Settings.archive_after_days:
+        return 0
+
+    now = datetime.now(timezone.utc)
+    before = now - timedelta(days=Settings.archive_after_days)
+    archived = 0
+    while True:
+        batch = (
+            await VoiceConvert.find(
+                {
+                    "task_status": {
+                        "$in": [TaskStatusEnum.completed, TaskStatusEnum.error]
+                    },
+                    "updated_at": {"$lt": before},
+                }
+            )
+            .limit(Settings.archive_batch_size)
+            .to_list()
+        )
+        if not batch:
+            break
+
+        try:
+            await VoiceConvertArchive.insert_many(
+                [to_archive(voice_task, now) for voice_task in batch], ordered=False
+            )
+        except BulkWriteError as e:
+            # already archived by an interrupted run
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+
+        await VoiceConvert.find(
+            {"uid": {"$in": [voice_task.uid for voice_task in batch]}}
+        ).delete()
+        archived += len(batch)
+
+    if archived:
+        logging.info(f"Archived {archived} voice conversions")
+    return archived
@@ -0,0 +1,248 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from beanie.odm.operators.update.general import Inc, Set
+from fastapi_mongo_base.core import exceptions
+from pymongo.errors import DuplicateKeyError
+from server.config import Settings
+
+from .models import RateLimitCounter, VoiceConvert
+from .schemas import VoiceConvertStage
+
+
+class TokenBucket:
+    """In-process token bucket, used to reject bursts without a database hit."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, amount: float = 1) -> bool:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+
+class Limiter:
+    # idle buckets refill, evicting the least recently used loses nothing
+    max_buckets = 10000
+
+    def __init__(
+        self,
+        scope: str,
+        per_minute: int,
+        burst: int,
+        max_concurrent: int,
+        daily_minutes: float,
+    ):
+        self.scope = scope
+        self.per_minute = per_minute
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.daily_minutes = daily_minutes
+        self.buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def _bucket(self, key: str) -> TokenBucket:
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(
+                rate=self.per_minute / 60, capacity=max(self.burst, 1)
+            )
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        self.buckets.move_to_end(key)
+        return self.buckets[key]
+
+    def _key(self, kind: str, key: str, now: datetime | None = None) -> str:
+        now = now or datetime.now(timezone.utc)
+        suffix = {
+            "rate": now.strftime(":%Y%m%d%H%M"),
+            "minutes": now.strftime(":%Y%m%d"),
+        }.get(kind, "")
+        return f"{self.scope}:{kind}:{key}{suffix}"
+
+    async def admit(self, key: str):
+        """Cheap checks first, then the counters shared between replicas."""
+        if self.per_minute:
+            if not self._bucket(key).consume():
+                raise_limit_exceeded("rate")
+            if not await acquire(self._key("rate", key), 1, self.per_minute, 120):
+                raise_limit_exceeded("rate")
+
+        if self.daily_minutes:
+            used = await RateLimitCounter.find_one({"key": self._key("minutes", key)})
+            if used and used.value >= self.daily_minutes:
+                raise_limit_exceeded("minutes")
+
+        if self.max_concurrent:
+            if not await acquire(
+                self._key("inflight", key), 1, self.max_concurrent, 24 * 3600
+            ):
+                raise_limit_exceeded("concurrency")
+
+    async def charge_minutes(
+        self, key: str, minutes: float, now: datetime | None = None
+    ) -> bool:
+        if not self.daily_minutes:
+            return True
+        return await acquire(
+            self._key("minutes", key, now),
+            minutes,
+            self.daily_minutes,
+            2 * 24 * 3600,
+        )
+
+    async def refund_minutes(
+        self, key: str, minutes: float, now: datetime | None = None
+    ):
+        """Give minutes back to the day they were charged to."""
+        if not self.daily_minutes:
+            return
+        await RateLimitCounter.find_one(
+            {"key": self._key("minutes", key, now), "value": {"$gte": minutes}}
+        ).update(Inc({"value": -minutes}))
+
+    async def release(self, key: str):
+        if not self.max_concurrent:
+            return
+        await RateLimitCounter.find_one(
+            {"key": self._key("inflight", key), "value": {"$gte": 1}}
+        ).update(Inc({"value": -1}))
+
+
+async def acquire(key: str, amount: float, limit: float, ttl: int) -> bool:
+    """
+    Atomically add `amount` to the counter unless it would go over `limit`.
+
+    The filter only matches while there is room left, so a full counter
+    falls through to the insert and fails on the unique `key` index. The
+    same error comes from two requests creating the counter at once, so the
+    conditional increment is tried once more before reporting it as full.
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    query = {"key": key, "value": {"$lte": limit - amount}}
+    operators = (Inc({"value": amount}), Set({"expires_at": expires_at}))
+    try:
+        await RateLimitCounter.find_one(query).upsert(
+            *operators,
+            on_insert=RateLimitCounter(key=key, value=amount, expires_at=expires_at),
+        )
+    except DuplicateKeyError:
+        result = await RateLimitCounter.find_one(query).update(*operators)
+        return bool(result and result.modified_count)
+    return True
+
+
+def raise_limit_exceeded(kind: str):
+    messages = {
+        "rate": {
+            "en": "Too many requests. Please try again later.",
+            "fa": "تعداد درخواست‌ها بیش از حد مجاز است. لطفا بعدا تلاش کنید.",
+        },
+        "minutes": {
+            "en": "Daily audio minutes budget is exhausted.",
+            "fa": "سهمیه دقایق صوتی روزانه به پایان رسیده است.",
+        },
+        "concurrency": {
+            "en": "Too many conversions in progress.",
+            "fa": "تعداد تبدیل‌های در حال انجام بیش از حد مجاز است.",
+        },
+    }
+    raise exceptions.BaseHTTPException(
+        status_code=429, error="too_many_requests", message=messages[kind]
+    )
+
+
+user_limiter = Limiter(
+    "user",
+    per_minute=Settings.rate_limit_per_minute,
+    burst=Settings.rate_limit_burst,
+    max_concurrent=Settings.max_concurrent_conversions,
+    daily_minutes=Settings.daily_minutes_budget,
+)
+tenant_limiter = Limiter(
+    "tenant",
+    per_minute=Settings.tenant_rate_limit_per_minute,
+    burst=Settings.tenant_rate_limit_per_minute,
+    max_concurrent=Settings.tenant_max_concurrent_conversions,
+    daily_minutes=Settings.tenant_daily_minutes_budget,
+)
+
+
+def _scopes(user_id, tenant_id):
+    yield user_limiter, str(user_id)
+    if tenant_id:
+        yield tenant_limiter, str(tenant_id)
+
+
+async def admit_conversion(user_id, tenant_id: str | None = None):
+    admitted = []
+    try:
+        for limiter, key in _scopes(user_id, tenant_id):
+            await limiter.admit(key)
+            admitted.append((limiter, key))
+    except exceptions.BaseHTTPException:
+        for limiter, key in admitted:
+            await limiter.release(key)
+        raise
+
+
+async def charge_conversion_minutes(
+    voice_task: VoiceConvert, minutes: float, now: datetime
+) -> bool:
+    """Charge every scope or none: scopes already charged are refunded."""
+    charged = []
+    for limiter, key in _scopes(voice_task.user_id, voice_task.tenant_id):
+        if not await limiter.charge_minutes(key, minutes, now):
+            logging.warning(
+                f"Daily minutes budget exceeded. {limiter.scope}:{key} {voice_task.uid}"
+            )
+            for charged_limiter, charged_key in charged:
+                await charged_limiter.refund_minutes(charged_key, minutes, now)
+            return False
+        charged.append((limiter, key))
+    return True
+
+
+async def refund_conversion_minutes(voice_task: VoiceConvert):
+    """Give back the minutes of a task that failed before it reached a backend."""
+    if voice_task.reached(VoiceConvertStage.dispatched):
+        return
+    result = await VoiceConvert.find_one(
+        {"uid": voice_task.uid, "charged_minutes": {"$gt": 0}}
+    ).update(Set({"charged_minutes": 0}))
+    if not result or not result.modified_count:
+        return
+    for limiter, key in _scopes(voice_task.user_id, voice_task.tenant_id):
+        await limiter.refund_minutes(
+            key, voice_task.charged_minutes, voice_task.charged_at
+        )
+    voice_task.charged_minutes = 0
+
+
+async def release_admission(user_id, tenant_id: str | None = None):
+    for limiter, key in _scopes(user_id, tenant_id):
+        await limiter.release(key)
+
+
+async def release_conversion(voice_task: VoiceConvert):
+    """
+    Give back the in-flight slot taken by `admit_conversion`, once. Tasks
+    that were never admitted, like admin requests, hold no slot.
+    """
+    result = await VoiceConvert.find_one(
+        {"uid": voice_task.uid, "admitted": True}
+    ).update(Set({"admitted": False}))
+    if not result or not result.modified_count:
+        return
+    voice_task.admitted = False
+    await release_admission(voice_task.user_id, voice_task.tenant_id)
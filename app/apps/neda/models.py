@@ -1,20 +1,138 @@
-from fastapi_mongo_base.models import OwnedEntity
+import uuid
+from datetime import datetime
 
-from .schemas import VoiceConvertStatus, VoiceConvertTaskSchema
+from fastapi_mongo_base.models import BaseEntity, OwnedEntity
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from utils.tasks import TaskStateMixin
 
+from .schemas import (
+    VoiceConvertListItemSchema,
+    VoiceConvertStage,
+    VoiceConvertTaskSchema,
+)
+
+
+class VoiceConvert(TaskStateMixin, VoiceConvertTaskSchema, OwnedEntity):
+    # processing state, kept out of the API responses and webhooks
+    # holds an in-flight slot from admit_conversion until released
+    admitted: bool = False
+    stage: VoiceConvertStage | None = None
+    worker_id: str | None = None
+    attempts: int = 0
+    # daily budget minutes charged, refunded if the task fails undispatched
+    charged_minutes: float = 0
+    charged_at: datetime | None = None
+    usage_id: str | None = None
+    # sent back in the webhook url, RunPod callbacks carry no job id
+    dispatch_id: str | None = None
+    backend: str | None = None
+    dispatched_at: datetime | None = None
+    webhook_events: list[str] = []
 
-class VoiceConvert(VoiceConvertTaskSchema, OwnedEntity):
     class Settings:
-        indexes = OwnedEntity.Settings.indexes
+        indexes = OwnedEntity.Settings.indexes + [
+            # keyset pagination of a user's history
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("created_at", DESCENDING),
+                    ("uid", DESCENDING),
+                ]
+            ),
+            # archival of finished tasks
+            IndexModel([("task_status", ASCENDING), ("updated_at", ASCENDING)]),
+        ]
 
     async def start_processing(self, **kwargs):
         from .services import convert_voice
 
         return await convert_voice(self, **kwargs)
 
+    @property
+    def webhook_exclude_fields(self) -> set[str]:
+        return {
+            "admitted",
+            "stage",
+            "worker_id",
+            "attempts",
+            "charged_minutes",
+            "charged_at",
+            "usage_id",
+            "dispatch_id",
+            "backend",
+            "dispatched_at",
+            "webhook_events",
+        }
+
+    def reached(self, stage: VoiceConvertStage) -> bool:
+        return self.stage is not None and self.stage.order >= stage.order
+
+    async def set_stage(self, stage: VoiceConvertStage, **fields):
+        self.stage = stage
+        await self.update_fields(stage=stage, **fields)
+
     async def fail(self, reason: str):
-        self.status = VoiceConvertStatus.error
-        await self.save_report(reason, log_type="error")
+        from .limits import refund_conversion_minutes, release_conversion
+        from .services import refund_cost
+
+        await self.record_failure(reason, meta_data=self.meta_data)
+        await refund_cost(self)
+        await refund_conversion_minutes(self)
+        await release_conversion(self)
+        await self.emit_signals(self)
 
     async def success(self, **kwargs):
         pass
+
+
+class RateLimitCounter(BaseEntity):
+    key: str
+    value: float = 0
+    expires_at: datetime | None = None
+
+    class Settings:
+        name = "rate_limit_counters"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+
+class PromptlyCacheEntry(BaseEntity):
+    """Responses of the Promptly API, shared by all processes."""
+
+    key: str
+    value: dict | list
+    expires_at: datetime
+
+    class Settings:
+        name = "promptly_cache"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+
+class VoiceConvertArchive(VoiceConvertListItemSchema, BaseEntity):
+    """
+    Finished conversions moved out of the hot collection, without the task
+    logs, reports and webhook bookkeeping.
+    """
+
+    user_id: uuid.UUID
+    tenant_id: str | None = None
+    duration: float | None = None
+    model_name: str | None = None
+    archived_at: datetime
+
+    class Settings:
+        name = "voice_convert_archive"
+        indexes = BaseEntity.Settings.indexes + [
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("created_at", DESCENDING),
+                    ("uid", DESCENDING),
+                ]
+            ),
+        ]
@@ -1,19 +1,28 @@
 import uuid
+from typing import Literal
 
 import fastapi
-from fastapi import BackgroundTasks
 from fastapi_mongo_base.routes import AbstractTaskRouter
 from fastapi_mongo_base.core import exceptions
+from pydantic import ValidationError
+from server import lifecycle
 from usso.fastapi import jwt_access_security
+from utils import auth, media, profiling
 
+from .backends import backend_router
+from .history import list_history
+from .limits import admit_conversion, release_admission
 from .models import VoiceConvert
 from .schemas import (
-    PredictionModelWebhookData,
-    RunpodWebhookData,
+    VoiceConvertCursorPage,
     VoiceConvertTaskCreateSchema,
     VoiceConvertTaskSchema,
 )
-from .services import process_convert_voice_webhook
+from .services import (
+    claim_convert_voice_webhook,
+    handle_convert_voice_webhook,
+    parse_convert_voice_webhook,
+)
 
 
 class VoiceConvertRouter(AbstractTaskRouter[VoiceConvert, VoiceConvertTaskSchema]):
@@ -27,7 +36,50 @@ class VoiceConvertRouter(AbstractTaskRouter[VoiceConvert, VoiceConvertTaskSchema
         )
 
     def config_routes(self, **kwargs):
+        self.router.add_api_route("/backends", self.backends_metrics, methods=["GET"])
+        self.router.add_api_route(
+            "/history",
+            self.history,
+            methods=["GET"],
+            response_model=VoiceConvertCursorPage,
+        )
         super().config_routes(update_route=False)
+        self.router.add_api_route(
+            "/{uid}/webhook/{provider}",
+            self.provider_webhook,
+            methods=["POST"],
+            status_code=200,
+        )
+
+    async def get_user(self, request: fastapi.Request, *args, **kwargs):
+        return await auth.cached_user(request, super().get_user)
+
+    async def backends_metrics(self, request: fastapi.Request):
+        user = await self.get_user(request)
+        if "admin" not in user.data.get("scopes", []):
+            raise exceptions.BaseHTTPException(
+                status_code=403,
+                error="Forbidden",
+                message={
+                    "en": "You are not allowed to see backend metrics.",
+                    "fa": "شما مجوز مشاهده وضعیت سرویس‌ها را ندارید.",
+                },
+            )
+        return backend_router.metrics()
+
+    async def history(
+        self,
+        request: fastapi.Request,
+        cursor: str | None = None,
+        limit: int = fastapi.Query(20, ge=1, le=100),
+        archived: bool = False,
+    ):
+        """
+        The user's conversions, newest first. Pass the returned `next_cursor`
+        to get the next page; `archived` lists the archived conversions.
+        """
+        user = await self.get_user(request)
+        return await list_history(user.uid, cursor, limit, archived)
 
     async def retrieve_item(
         self,
@@ -46,13 +98,13 @@ class VoiceConvertRouter(AbstractTaskRouter[VoiceConvert, VoiceConvertTaskSchema
         self,
         request: fastapi.Request,
         data: VoiceConvertTaskCreateSchema,
-        background_tasks: BackgroundTasks,
         # user_id: uuid.UUID | None = fastapi.Body(
         #     default=None,
         #     embed=True,
         #     description="Request for another User ID. It is possible only if the request user is admin. If not provided, the request user will be used.",
         # ),
     ):
+        lifecycle.ensure_accepting()
         user = await self.get_user(request)
         is_admin = "admin" in user.data.get("scopes", [])
         # import logging
@@ -69,20 +121,105 @@ class VoiceConvertRouter(AbstractTaskRouter[VoiceConvert, VoiceConvertTaskSchema
         #     )
 
         user_id = user.uid
-        item = await self.model.create_item({**data.model_dump(), "user_id": user_id})
-
+        tenant_id = user.data.get("tenant_id")
+        if not is_admin:
+            await admit_conversion(user_id, tenant_id)
+
+        try:
+            probe = await media.probe_url(data.url)
+            if not probe.ok and probe.retryable:
+                raise exceptions.BaseHTTPException(
+                    status_code=503,
+                    error="audio_url_unavailable",
+                    message={
+                        "en": probe.reason,
+                        "fa": "فایل صوتی در حال حاضر در دسترس نیست. لطفا دوباره تلاش کنید.",
+                    },
+                )
+            if not probe.ok:
+                raise exceptions.BaseHTTPException(
+                    status_code=400,
+                    error="invalid_audio_url",
+                    message={
+                        "en": probe.reason,
+                        "fa": "فایل صوتی ارسال شده قابل پردازش نیست.",
+                    },
+                )
+
+            item = await self.model.create_item(
+                {
+                    **data.model_dump(),
+                    "user_id": user_id,
+                    "tenant_id": tenant_id,
+                    # init, not draft: resume and drain look for init tasks
+                    "task_status": "init",
+                    "admitted": not is_admin,
+                    "worker_id": lifecycle.instance_id,
+                }
+            )
+        except Exception:
+            # the slot only belongs to a task once the task exists
+            if not is_admin:
+                await release_admission(user_id, tenant_id)
+            raise
+
+        profile = (
+            is_admin and request.headers.get("X-Profile") == "1"
+        ) or profiling.sampled()
         if item.task_status == "init" or not self.draftable:
-            background_tasks.add_task(item.start_processing)
+            lifecycle.spawn(item.start_processing(profile=profile))
         return item
 
     async def webhook(
         self,
         uid: uuid.UUID,
         request: fastapi.Request,
-        data: PredictionModelWebhookData | RunpodWebhookData,
+        data: dict = fastapi.Body(...),
+        dispatch: str | None = None,
+    ):
+        return await self._ingest_webhook(uid, data, dispatch_id=dispatch)
+
+    async def provider_webhook(
+        self,
+        uid: uuid.UUID,
+        provider: Literal["runpod", "replicate"],
+        data: dict = fastapi.Body(...),
+        dispatch: str | None = None,
+    ):
+        return await self._ingest_webhook(uid, data, provider, dispatch)
+
+    async def _ingest_webhook(
+        self,
+        uid: uuid.UUID,
+        payload: dict,
+        provider: str | None = None,
+        dispatch_id: str | None = None,
     ):
-        voice_task = await VoiceConvert.get_by_uid(uid)
-        await process_convert_voice_webhook(voice_task, data)
+        """
+        Acknowledge a provider callback right away: validate it, drop
+        duplicates with a conditional update and leave the output handling to
+        a background task.
+        """
+        try:
+            data = parse_convert_voice_webhook(payload, provider, dispatch_id)
+        except ValidationError as e:
+            raise exceptions.BaseHTTPException(
+                status_code=422,
+                error="invalid_webhook",
+                message={"en": str(e), "fa": "اطلاعات وب‌هوک نامعتبر است."},
+            )
+
+        claimed = await claim_convert_voice_webhook(uid, data.event_key)
+        if claimed is None:
+            raise exceptions.BaseHTTPException(
+                status_code=404,
+                error="item_not_found",
+                message={"en": "Voice task not found.", "fa": "درخواست پیدا نشد."},
+            )
+        if not claimed:
+            return {"message": "Duplicate webhook ignored"}
+
+        lifecycle.spawn(handle_convert_voice_webhook(uid, data))
         return {"message": "Webhook received"}
 
 
@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime
 from enum import Enum
 from typing import Literal
@@ -48,10 +49,23 @@ class VoiceConvertStatus(str, Enum):
         }.get(self, 0)
 
 
+class VoiceConvertStage(str, Enum):
+    """Completed processing stages, in order. Resuming skips what is done."""
+
+    analyzed = "analyzed"
+    billed = "billed"
+    pitched = "pitched"
+    dispatched = "dispatched"
+
+    @property
+    def order(self) -> int:
+        return list(self.__class__).index(self)
+
+
 class VoiceConvertTaskCreateSchema(BaseModel):
     url: str
     pitch_difference: float | None = None
-    target_voice: str 
+    target_voice: str
 
     meta_data: dict | None = None
     webhook_url: str | None = None
@@ -67,6 +81,7 @@ class VoiceConvertTaskSchema(
     VoiceConvertTaskCreateSchema, TaskMixin, OwnedEntitySchema
 ):
     estimated_cost: float | None = None
+    tenant_id: str | None = None
 
     status: VoiceConvertStatus = VoiceConvertStatus.draft
     run_id: str | None = None
@@ -98,6 +113,27 @@ class VoiceConvertTaskSchema(
         return Path(urlparse(self.url).path).stem
 
 
+class VoiceConvertListItemSchema(BaseModel):
+    """The fields a history list shows, fetched with a projection."""
+
+    uid: uuid.UUID
+    created_at: datetime
+    updated_at: datetime | None = None
+    target_voice: str
+    url: str
+    output_url: str | None = None
+    status: VoiceConvertStatus
+    task_status: TaskStatusEnum
+    task_progress: int = 0
+    estimated_cost: float | None = None
+
+
+class VoiceConvertCursorPage(BaseModel):
+    items: list[VoiceConvertListItemSchema]
+    next_cursor: str | None = None
+    limit: int
+
+
 class PredictionModelWebhookData(BaseModel):
     completed_at: datetime | None = None
     created_at: datetime
@@ -126,6 +162,10 @@ class PredictionModelWebhookData(BaseModel):
         item.percentage = item.status.progress
         return item
 
+    @property
+    def event_key(self) -> str:
+        return f"{self.id}:{self.status.value}"
+
 
 class RunpodWebhookData(BaseModel):
     output_url: str | None = None
@@ -134,6 +174,18 @@ class RunpodWebhookData(BaseModel):
     message: str | None = None
     error: str | None = None
     traceback: str | None = None
+    # from the webhook url, not the payload
+    dispatch_id: str | None = Field(default=None, exclude=True)
+
+    @property
+    def event_key(self) -> str:
+        return f"runpod:{self.dispatch_id}:{'error' if self.error else 'completed'}"
+
+
+webhook_schemas: dict[str, type[PredictionModelWebhookData | RunpodWebhookData]] = {
+    "replicate": PredictionModelWebhookData,
+    "runpod": RunpodWebhookData,
+}
 
 
 class VoiceInput(BaseModel):
@@ -1,26 +1,42 @@
 import logging
+import uuid
+from datetime import datetime, timezone
 from io import BytesIO
 
 import httpx
 from aiocache import cached
 from apps.voice.models import VoiceModel
+from beanie.odm.operators.update.array import AddToSet, Pull
+from beanie.odm.operators.update.general import Set
 from server.config import Settings
-from utils import finance, media, voice
+from utils import finance, media, profiling
 
+from .backends import backend_router
+from .limits import charge_conversion_minutes, release_conversion
 from .models import VoiceConvert
 from .schemas import (
     PredictionModelWebhookData,
     RunpodWebhookData,
+    VoiceConvertStage,
     VoiceConvertStatus,
+    webhook_schemas,
 )
 
 
 @cached(ttl=60 * 10)
 async def get_voice(url: str) -> BytesIO:
+    """Download the audio, giving up as soon as it is over the size limit."""
+    content = bytearray()
     async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        response.raise_for_status()
-        return BytesIO(response.content)
+        async with client.stream("GET", url, follow_redirects=True) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                content += chunk
+                if len(content) > Settings.max_audio_size:
+                    raise ValueError(
+                        f"Audio is larger than {Settings.max_audio_size} bytes."
+                    )
+    return BytesIO(bytes(content))
 
 
 async def register_cost(voice_task: VoiceConvert):
@@ -31,81 +47,330 @@ async def register_cost(voice_task: VoiceConvert):
         if usage:
             return usage
     except Exception as e:
-        logging.error(f"Error registering cost. {voice_task.user_id} {voice_task.uid} {e}")
+        logging.error(
+            f"Error registering cost. {voice_task.user_id} {voice_task.uid} {e}"
+        )
 
     logging.error(f"Insufficient balance. {voice_task.user_id} {voice_task.id}")
     await voice_task.fail("Insufficient balance.")
 
 
-async def convert_voice(voice_task: VoiceConvert, **kwargs):
-    duration = voice.get_duration(await get_voice(voice_task.url))
-    voice_task.meta_data = (voice_task.meta_data or {}) | (
-        {
-            "duration": duration,
-        }
-    )
-    usage = await register_cost(voice_task)
-
-    if usage is None:
+async def refund_cost(voice_task: VoiceConvert):
+    """Cancel the usage of a task that failed before it reached a backend."""
+    if not voice_task.usage_id or voice_task.reached(VoiceConvertStage.dispatched):
         return
+    try:
+        await finance.cancel_usage(voice_task.usage_id)
+    except Exception as e:
+        logging.error(f"Error cancelling usage. {voice_task.uid} {e}")
+        return
+    voice_task.usage_id = None
+    await voice_task.update_fields(usage_id=None)
 
-    model = await VoiceModel.get_by_slug(voice_task.target_voice)
-    voice_task.meta_data.update(
-        {
-            "model_name": model.name,
-            "model_thumbnail": model.thumbnail,
-        }
-    )
 
+async def convert_voice(voice_task: VoiceConvert, profile: bool = False, **kwargs):
+    """
+    Convert, optionally under the profiler. The profile summary is attached
+    to `meta_data["profile"]`, the stacks are dumped to `Settings.profile_dir`.
+    An unexpected error fails the task rather than leaving it processing.
+    """
+    try:
+        if not profile:
+            return await run_convert_voice(voice_task)
+
+        with profiling.profile_job(str(voice_task.uid)) as job:
+            try:
+                return await run_convert_voice(voice_task)
+            finally:
+                voice_task.meta_data = (voice_task.meta_data or {}) | {
+                    "profile": job.summary()
+                }
+                await voice_task.update_fields(meta_data=voice_task.meta_data)
+    except Exception as e:
+        logging.error(f"Voice conversion failed {voice_task.uid} {e!r}")
+        await voice_task.fail(f"Voice conversion failed. {e}")
+
+
+async def run_convert_voice(voice_task: VoiceConvert):
+    """
+    Run the conversion stages in order, persisting a stage cursor after each
+    one so a task interrupted by a restart resumes where it stopped instead
+    of downloading, analysing or billing again.
+    """
+    # the audio stack is heavy to import, keep it out of API-only processes
+    from utils import voice
+
+    if not voice_task.reached(VoiceConvertStage.analyzed):
+        with profiling.stage("download"):
+            audio = await get_voice(voice_task.url)
+        with profiling.stage("duration"):
+            duration = voice.get_duration(audio)
+        voice_task.meta_data = (voice_task.meta_data or {}) | (
+            {
+                "duration": duration,
+            }
+        )
+        if duration > Settings.max_audio_duration:
+            await voice_task.fail(
+                f"Audio is too long ({duration:.0f}s, "
+                f"limit {Settings.max_audio_duration:.0f}s)."
+            )
+            return
+
+        charged_at = datetime.now(timezone.utc)
+        if not await charge_conversion_minutes(voice_task, duration / 60, charged_at):
+            await voice_task.fail("Daily audio minutes budget exceeded.")
+            return
+        voice_task.charged_minutes = duration / 60
+        voice_task.charged_at = charged_at
+        await voice_task.set_stage(
+            VoiceConvertStage.analyzed,
+            meta_data=voice_task.meta_data,
+            charged_minutes=voice_task.charged_minutes,
+            charged_at=charged_at,
+        )
+    duration = voice_task.meta_data["duration"]
+
+    if not voice_task.reached(VoiceConvertStage.billed):
+        with profiling.stage("billing"):
+            usage = await register_cost(voice_task)
+
+        if usage is None:
+            return
+        usage_id = getattr(usage, "uid", None)
+        voice_task.usage_id = usage_id and str(usage_id)
+        await voice_task.set_stage(
+            VoiceConvertStage.billed, usage_id=voice_task.usage_id
+        )
+
+    model = await VoiceModel.get_by_slug(voice_task.target_voice)
     if not model:
         await voice_task.fail("Model not found.")
         return
 
-    if voice_task.pitch_difference is None:
-        voice_task._status = VoiceConvertStatus.pitch_conversion
-        await voice_task.save()
+    if not voice_task.reached(VoiceConvertStage.pitched):
+        voice_task.meta_data.update(
+            {
+                "model_name": model.name,
+                "model_thumbnail": model.thumbnail,
+            }
+        )
+
+        if voice_task.pitch_difference is None:
+            await voice_task.set_status(
+                VoiceConvertStatus.pitch_conversion, meta_data=voice_task.meta_data
+            )
 
-        pitch_data = voice.get_voice_pitch_parselmouth(await get_voice(voice_task.url))
-        voice_task.pitch_difference = voice.calculate_pitch_shift_log(
-            pitch_data["robust_average"], model.base_pitch
+            with profiling.stage("download"):
+                audio = await get_voice(voice_task.url)
+            with profiling.stage("pitch"):
+                pitch_data = voice.get_voice_pitch_parselmouth(audio)
+            voice_task.pitch_difference = voice.calculate_pitch_shift_log(
+                pitch_data["robust_average"], model.base_pitch
+            )
+        await voice_task.set_stage(
+            VoiceConvertStage.pitched,
+            pitch_difference=voice_task.pitch_difference,
+            meta_data=voice_task.meta_data,
         )
 
-    run_id = voice.create_rvc_conversion_runpod(
-        voice_task.url,
-        model.model_url,
-        voice_task.pitch_difference,
-        voice_task.item_webhook_url,
-    )
+    if voice_task.reached(VoiceConvertStage.dispatched):
+        return
+
+    # saved before the job exists, so even an early callback can be matched
+    voice_task.dispatch_id = uuid.uuid4().hex
+    await voice_task.update_fields(dispatch_id=voice_task.dispatch_id)
+    try:
+        with profiling.stage("dispatch"):
+            backend, run_id = await backend_router.dispatch(
+                voice_task.url,
+                model.model_url,
+                voice_task.pitch_difference,
+                voice_task.item_webhook_url,
+                duration=duration,
+                model_slug=model.slug,
+                dispatch_id=voice_task.dispatch_id,
+            )
+    except Exception as e:
+        await voice_task.fail(f"Voice conversion could not be started. {e}")
+        return
 
+    voice_task.stage = VoiceConvertStage.dispatched
     voice_task._status = VoiceConvertStatus.voice_change
-    voice_task.run_id = run_id
-    await voice_task.save()
+    # an early callback may have finished the task already, keep its status
+    result = await VoiceConvert.find_one(
+        {
+            "uid": voice_task.uid,
+            "status": {
+                "$nin": [VoiceConvertStatus.completed, VoiceConvertStatus.error]
+            },
+        }
+    ).update(
+        Set(
+            {
+                **voice_task._status_fields(),
+                "stage": voice_task.stage,
+                "run_id": run_id,
+                "backend": backend.name,
+                "dispatched_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc),
+            }
+        )
+    )
+    if not result or not result.modified_count:
+        logging.info(f"Task finished before its dispatch was saved {voice_task.uid}")
+
+
+def record_backend_result(voice_task: VoiceConvert, success: bool):
+    backend = backend_router.get(voice_task.backend)
+    if backend is None:
+        return
+
+    backend.dequeue()
+    if not success:
+        backend.record_failure()
+        return
+
+    latency = None
+    if voice_task.dispatched_at:
+        dispatched_at = voice_task.dispatched_at
+        if dispatched_at.tzinfo is None:
+            dispatched_at = dispatched_at.replace(tzinfo=timezone.utc)
+        latency = (datetime.now(timezone.utc) - dispatched_at).total_seconds()
+    backend.record_success(latency)
 
 
 async def process_convert_voice_webhook(
     voice_task: VoiceConvert, data: PredictionModelWebhookData | RunpodWebhookData
 ):
+    if data.error or (
+        isinstance(data, PredictionModelWebhookData)
+        and data.status == VoiceConvertStatus.error
+    ):
+        record_backend_result(voice_task, success=False)
+        await voice_task.fail(f"Voice conversion failed. {data.error}")
+        return
+
+    record_backend_result(voice_task, success=True)
     if isinstance(data, PredictionModelWebhookData):
-        if voice_task.status == VoiceConvertStatus.voice_change:
-            output_url = await media.upload_file(
-                data.output,
-                file_name=f"{voice_task.target_voice}.wav",
-                user_id=voice_task.user_id,
-            )
+        output = data.output[-1] if isinstance(data.output, list) else data.output
+        output_url = await media.upload_file(
+            output,
+            file_name=f"{voice_task.target_voice}.wav",
+            user_id=voice_task.user_id,
+        )
     else:
         output_url = data.output_url
 
-    voice_task._status = VoiceConvertStatus.completed
-    voice_task.output_url = output_url
-    await voice_task.save()
+    await voice_task.set_status(VoiceConvertStatus.completed, output_url=output_url)
+    await release_conversion(voice_task)
 
     if voice_task.webhook_url:
         async with httpx.AsyncClient() as client:
             await client.post(
                 voice_task.webhook_url,
-                json=voice_task.model_dump(mode="json"),
+                json=voice_task.model_dump(
+                    mode="json", exclude=voice_task.webhook_exclude_fields
+                ),
             )
 
 
+def parse_convert_voice_webhook(
+    payload: dict, provider: str | None = None, dispatch_id: str | None = None
+) -> PredictionModelWebhookData | RunpodWebhookData:
+    """Validate against the provider's schema instead of trying the union."""
+    if provider is None:
+        provider = "replicate" if "version" in payload else "runpod"
+    data = webhook_schemas[provider].model_validate(payload)
+    if isinstance(data, RunpodWebhookData):
+        data.dispatch_id = dispatch_id
+    return data
+
+
+async def claim_convert_voice_webhook(uid, event_key: str) -> bool | None:
+    """
+    Record the callback on the task unless it was seen before. Returns None
+    when the task does not exist and False for duplicates.
+    """
+    result = await VoiceConvert.find_one(
+        {"uid": uid, "webhook_events": {"$ne": event_key}}
+    ).update(AddToSet({"webhook_events": event_key}))
+    if result.modified_count:
+        return True
+    if await VoiceConvert.find_one({"uid": uid}).count():
+        return False
+    return None
+
+
+async def unclaim_convert_voice_webhook(uid, event_key: str):
+    await VoiceConvert.find_one({"uid": uid}).update(
+        Pull({"webhook_events": event_key})
+    )
+
+
+async def handle_convert_voice_webhook(
+    uid, data: PredictionModelWebhookData | RunpodWebhookData
+):
+    voice_task = await VoiceConvert.get_by_uid(uid)
+    if voice_task.status in (VoiceConvertStatus.completed, VoiceConvertStatus.error):
+        logging.info(f"Webhook for finished task ignored {uid} {data.event_key}")
+        return
+    if isinstance(data, PredictionModelWebhookData):
+        # the run id is saved after submit returns, a callback can beat it
+        in_flight = voice_task.run_id is None and not voice_task.reached(
+            VoiceConvertStage.dispatched
+        )
+        stale = data.id != voice_task.run_id and not in_flight
+    else:
+        stale = data.dispatch_id != voice_task.dispatch_id
+    if stale:
+        logging.warning(f"Webhook for stale run ignored {uid} {data.event_key}")
+        await unclaim_convert_voice_webhook(uid, data.event_key)
+        return
+    try:
+        await process_convert_voice_webhook(voice_task, data)
+    except Exception:
+        # forget the callback so a retry or the status poll can handle it
+        await unclaim_convert_voice_webhook(uid, data.event_key)
+        raise
+
+
 async def check_open_voice_convert_status(voice_task: VoiceConvert):
-    pass
+    """
+    Collect the result of a dispatched job whose webhook is overdue, or whose
+    webhook was accepted by a process that died before handling it.
+    """
+    if not voice_task.reached(VoiceConvertStage.dispatched) or not voice_task.run_id:
+        return
+    dispatched_at = voice_task.dispatched_at or voice_task.updated_at
+    if dispatched_at.tzinfo is None:
+        dispatched_at = dispatched_at.replace(tzinfo=timezone.utc)
+    if (datetime.now(timezone.utc) - dispatched_at).total_seconds() < (
+        Settings.webhook_grace
+    ):
+        return
+
+    backend = backend_router.get(voice_task.backend)
+    if backend is None:
+        return
+    try:
+        payload = await backend.status(voice_task.run_id)
+    except Exception as e:
+        logging.warning(f"Backend status failed {voice_task.uid} {e!r}")
+        return
+    if payload is None:
+        return
+
+    data = parse_convert_voice_webhook(
+        payload, backend.provider, voice_task.dispatch_id
+    )
+    claimed = await claim_convert_voice_webhook(voice_task.uid, data.event_key)
+    updated_at = voice_task.updated_at
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    stale = (datetime.now(timezone.utc) - updated_at).total_seconds() > (
+        Settings.resume_stale_after
+    )
+    if claimed or stale:
+        logging.info(f"Collected overdue result {voice_task.uid} {data.event_key}")
+        await handle_convert_voice_webhook(voice_task.uid, data)
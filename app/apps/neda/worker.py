@@ -1,8 +1,16 @@
-import asyncio
+import time
+from datetime import datetime, timedelta, timezone
 
+from apps.voice.models import VoiceModel
 from fastapi_mongo_base.tasks import TaskStatusEnum
+from server import lifecycle
+from server.config import Settings
+from utils.tasks import release_tasks, resume_tasks
 
+from .backends import backend_router
+from .limits import acquire
 from .models import VoiceConvert
+from .schemas import VoiceConvertStage
 from .services import check_open_voice_convert_status
 
 
@@ -12,9 +20,57 @@ async def update_voice_convert():
         .find(
             {
                 "task_status": {"$in": [TaskStatusEnum.processing]},
+                "stage": VoiceConvertStage.dispatched,
             }
         )
         .to_list()
     )
     for voice_convert in data:
-        asyncio.create_task(check_open_voice_convert_status(voice_convert))
+        lifecycle.spawn(check_open_voice_convert_status(voice_convert))
+
+
+def _unfinished_query() -> dict:
+    return {
+        "task_status": {"$in": [TaskStatusEnum.init, TaskStatusEnum.processing]},
+        "stage": {"$ne": VoiceConvertStage.dispatched},
+        "is_deleted": False,
+    }
+
+
+@lifecycle.on_resume
+async def resume_voice_converts():
+    """Continue conversions left unfinished by another process from their stage."""
+    await resume_tasks(VoiceConvert, _unfinished_query())
+
+
+@lifecycle.on_drain
+async def release_voice_converts():
+    await release_tasks(VoiceConvert, _unfinished_query())
+
+
+async def prewarm_popular_models():
+    """Keep the recently requested voice models loaded on some backend."""
+    if not Settings.prewarm_audio_url:
+        return
+
+    # one replica per interval sends the prewarm jobs
+    window = int(time.time() // Settings.prewarm_interval)
+    if not await acquire(f"prewarm:{window}", 1, 1, 2 * Settings.prewarm_interval):
+        return
+
+    since = datetime.now(timezone.utc) - timedelta(seconds=Settings.prewarm_window)
+    popular = await VoiceConvert.aggregate(
+        [
+            {"$match": {"created_at": {"$gte": since}}},
+            {"$group": {"_id": "$target_voice", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": Settings.prewarm_models},
+        ]
+    ).to_list()
+
+    for item in popular:
+        model = await VoiceModel.get_by_slug(item["_id"])
+        if model:
+            await backend_router.prewarm(
+                model.slug, model.model_url, Settings.prewarm_audio_url
+            )
@@ -1,7 +1,8 @@
 from fastapi_mongo_base.models import OwnedEntity
 from pymongo import ASCENDING, IndexModel
+from utils.tasks import TaskStateMixin
 
-from .schemas import VoiceModelSchema
+from .schemas import VoiceModelSchema, VoiceTrainingSchema
 
 
 class VoiceModel(VoiceModelSchema, OwnedEntity):
@@ -13,3 +14,21 @@ class VoiceModel(VoiceModelSchema, OwnedEntity):
     @classmethod
     async def get_by_slug(cls, slug: str = "default"):
         return await cls.find_one({"slug": slug})
+
+
+class VoiceTraining(TaskStateMixin, VoiceTrainingSchema, OwnedEntity):
+    # the process running it, kept out of the API responses and webhooks
+    worker_id: str | None = None
+    attempts: int = 0
+
+    class Settings:
+        indexes = OwnedEntity.Settings.indexes
+
+    async def start_processing(self, **kwargs):
+        from .services import train_voice
+
+        return await train_voice(self, **kwargs)
+
+    @property
+    def webhook_exclude_fields(self) -> set[str]:
+        return {"worker_id", "attempts"}
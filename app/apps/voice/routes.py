@@ -1,8 +1,20 @@
+import uuid
+
 import fastapi
+from fastapi_mongo_base.core import exceptions
 from fastapi_mongo_base.routes import AbstractBaseRouter
+from server import lifecycle
+from usso.fastapi import jwt_access_security
+from utils import auth
 
-from .models import VoiceModel
-from .schemas import VoiceModelSchema, VoiceTrainingSchema
+from .models import VoiceModel, VoiceTraining
+from .schemas import (
+    VoiceModelSchema,
+    VoiceTrainingCreateSchema,
+    VoiceTrainingSchema,
+    VoiceTrainingWebhookData,
+)
+from .services import process_training_webhook
 
 
 class VoiceModelRouter(AbstractBaseRouter[VoiceModel, VoiceModelSchema]):
@@ -16,7 +28,25 @@ class VoiceModelRouter(AbstractBaseRouter[VoiceModel, VoiceModelSchema]):
 
     def config_routes(self, **kwargs):
         super().config_routes()
-        self.router.add_route("/train", self.train_item, methods=["POST"])
+        self.router.add_api_route(
+            "/train",
+            self.train_item,
+            methods=["POST"],
+            response_model=VoiceTrainingSchema,
+            status_code=201,
+        )
+        self.router.add_api_route(
+            "/train/{uid}",
+            self.retrieve_training,
+            methods=["GET"],
+            response_model=VoiceTrainingSchema,
+        )
+        self.router.add_api_route(
+            "/train/{uid}/webhook",
+            self.training_webhook,
+            methods=["POST"],
+            status_code=200,
+        )
 
     async def create_item(
         self,
@@ -35,9 +65,55 @@ class VoiceModelRouter(AbstractBaseRouter[VoiceModel, VoiceModelSchema]):
     async def train_item(
         self,
         request: fastapi.Request,
-        data: VoiceTrainingSchema,
+        data: VoiceTrainingCreateSchema,
+    ):
+        lifecycle.ensure_accepting()
+        user = await auth.cached_user(request, jwt_access_security)
+        item = await VoiceTraining.create_item(
+            {
+                **data.model_dump(),
+                "user_id": user.uid,
+                "task_status": "init",
+                "worker_id": lifecycle.instance_id,
+            }
+        )
+        lifecycle.spawn(item.start_processing())
+        return item
+
+    async def retrieve_training(self, request: fastapi.Request, uid: uuid.UUID):
+        user = await auth.cached_user(request, jwt_access_security)
+        if "admin" in user.data.get("scopes", []):
+            item = await VoiceTraining.get_item(uid, ignore_user_id=True)
+        else:
+            item = await VoiceTraining.get_item(uid, user_id=user.uid)
+        if item is None:
+            raise exceptions.BaseHTTPException(
+                status_code=404,
+                error="item_not_found",
+                message={
+                    "en": "Training not found.",
+                    "fa": "آموزش مدل پیدا نشد.",
+                },
+            )
+        return item
+
+    async def training_webhook(
+        self,
+        uid: uuid.UUID,
+        data: VoiceTrainingWebhookData,
     ):
-        raise NotImplementedError
+        item = await VoiceTraining.get_by_uid(uid)
+        if item is None:
+            raise exceptions.BaseHTTPException(
+                status_code=404,
+                error="item_not_found",
+                message={
+                    "en": "Training not found.",
+                    "fa": "آموزش مدل پیدا نشد.",
+                },
+            )
+        lifecycle.spawn(process_training_webhook(item, data))
+        return {"message": "Webhook received"}
 
 
 router = VoiceModelRouter().router
@@ -1,10 +1,90 @@
+from enum import Enum
 from typing import Literal
 
 from fastapi_mongo_base.schemas import OwnedEntitySchema
+from fastapi_mongo_base.tasks import TaskMixin, TaskStatusEnum
+from pydantic import BaseModel, field_validator
 
 
-class VoiceTrainingSchema(OwnedEntitySchema):
-    training_data: str
+class VoiceTrainingStatus(str, Enum):
+    init = "init"
+    preprocessing = "preprocessing"
+    training = "training"
+    completed = "completed"
+    error = "error"
+
+    def get_task_status(self) -> TaskStatusEnum:
+        return {
+            self.init: TaskStatusEnum.init,
+            self.preprocessing: TaskStatusEnum.processing,
+            self.training: TaskStatusEnum.processing,
+            self.completed: TaskStatusEnum.completed,
+            self.error: TaskStatusEnum.error,
+        }[self]
+
+    @property
+    def progress(self):
+        return {
+            self.__class__.preprocessing: 10,
+            self.__class__.training: 60,
+            self.__class__.completed: 100,
+            self.__class__.error: 100,
+        }.get(self, 0)
+
+
+class VoiceTrainingCreateSchema(BaseModel):
+    name: str
+    slug: str
+    training_data: list[str]
+
+    category: str | None = None
+    gender: Literal["male", "female"] = "male"
+    meta_data: dict | None = None
+    webhook_url: str | None = None
+
+    @field_validator("training_data", mode="before")
+    def validate_training_data(cls, v):
+        if isinstance(v, str):
+            v = [v]
+        v = [url.strip() for url in v if url and url.strip().startswith("http")]
+        if not v:
+            raise ValueError("At least one training clip URL is required")
+        return v
+
+
+class VoiceTrainingSchema(VoiceTrainingCreateSchema, TaskMixin, OwnedEntitySchema):
+    status: VoiceTrainingStatus = VoiceTrainingStatus.init
+    clips_total: int = 0
+    clips_done: int = 0
+    feature_store: str | None = None
+    base_pitch: float | None = None
+    run_id: str | None = None
+    model_url: str | None = None
+
+    @property
+    def item_url(self):
+        from server.config import Settings
+
+        return (
+            f"https://{Settings.root_url}{Settings.base_path}/models/train/{self.uid}"
+        )
+
+    @property
+    def _status(self) -> VoiceTrainingStatus:
+        return self.status
+
+    @_status.setter
+    def _status(self, value: VoiceTrainingStatus | str):
+        if isinstance(value, str):
+            value = VoiceTrainingStatus(value)
+        self.status = value
+        self.task_status = value.get_task_status()
+        self.task_progress = value.progress
+
+
+class VoiceTrainingWebhookData(BaseModel):
+    model_url: str | None = None
+    error: str | None = None
 
 
 class VoiceModelSchema(OwnedEntitySchema):
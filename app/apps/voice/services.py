@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+from pymongo.errors import DuplicateKeyError
+from server.config import Settings
+from utils import rvc
+
+from .models import VoiceModel, VoiceTraining
+from .schemas import VoiceTrainingStatus, VoiceTrainingWebhookData
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    One pool per process for the CPU bound preprocessing. Workers are spawned,
+    not forked, so they do not inherit the event loop or database clients.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=Settings.training_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def download_clip(client: httpx.AsyncClient, url: str) -> bytes:
+    """Download a clip, giving up as soon as it is known to be over the limit."""
+    async with client.stream("GET", url, follow_redirects=True) as response:
+        response.raise_for_status()
+        size = response.headers.get("content-length", "")
+        if size.isdigit() and int(size) > Settings.max_audio_size:
+            raise ValueError(f"Clip is too large ({size} bytes)")
+
+        content = bytearray()
+        async for chunk in response.aiter_bytes():
+            content += chunk
+            if len(content) > Settings.max_audio_size:
+                raise ValueError(f"Clip is larger than {Settings.max_audio_size} bytes")
+    return bytes(content)
+
+
+async def preprocess_dataset(training: VoiceTraining) -> list[dict]:
+    """
+    Fan the clips out over the process pool, keeping at most one downloaded
+    clip per worker in memory, and report progress as clips finish.
+    """
+    from utils import voice
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    semaphore = asyncio.Semaphore(Settings.training_workers)
+    store_dir = str(Settings.feature_store_dir / str(training.uid))
+
+    async def process(client: httpx.AsyncClient, index: int, url: str):
+        async with semaphore:
+            content = await download_clip(client, url)
+            return await loop.run_in_executor(
+                executor,
+                voice.preprocess_clip,
+                content,
+                index,
+                store_dir,
+                Settings.training_slice_seconds,
+            )
+
+    start = VoiceTrainingStatus.preprocessing.progress
+    end = VoiceTrainingStatus.training.progress
+    results = []
+    async with httpx.AsyncClient(timeout=60) as client:
+        tasks = [
+            asyncio.create_task(process(client, index, url))
+            for index, url in enumerate(training.training_data)
+        ]
+        for future in asyncio.as_completed(tasks):
+            try:
+                results.append(await future)
+            except Exception as e:
+                logging.warning(f"Training clip failed {training.uid} {e!r}")
+            training.clips_done += 1
+            progress = start + (end - start) * training.clips_done // len(tasks)
+            await training.update_fields(
+                clips_done=training.clips_done, task_progress=progress
+            )
+
+    return sorted(results, key=lambda item: item["index"])
+
+
+async def train_voice(training: VoiceTraining, **kwargs):
+    """Train, failing the task on an unexpected error rather than leaving it."""
+    try:
+        await run_train_voice(training)
+    except Exception as e:
+        logging.error(f"Voice training failed {training.uid} {e!r}")
+        await training.fail(f"Voice training failed. {e}")
+
+
+async def run_train_voice(training: VoiceTraining):
+    from utils.feature_store import FeatureStore
+
+    if await VoiceModel.get_by_slug(training.slug):
+        await training.fail("A voice model with this slug already exists.")
+        return
+
+    training.clips_total = len(training.training_data)
+    training.clips_done = 0
+    await training.set_status(
+        VoiceTrainingStatus.preprocessing,
+        clips_total=training.clips_total,
+        clips_done=0,
+    )
+
+    results = await preprocess_dataset(training)
+    results = [item for item in results if item["slices"]]
+    if not results:
+        await training.fail("No usable audio in the training data.")
+        return
+
+    voiced_frames = sum(item["voiced_frames"] for item in results)
+    base_pitch = (
+        float(2 ** (sum(item["log2_pitch_sum"] for item in results) / voiced_frames))
+        if voiced_frames
+        else 0
+    )
+    store = FeatureStore(Settings.feature_store_dir / str(training.uid))
+    store.write_manifest(
+        {
+            "name": training.name,
+            "slug": training.slug,
+            "sample_rate": 16000,
+            "slice_seconds": Settings.training_slice_seconds,
+            "base_pitch": base_pitch,
+            "duration": sum(item["duration"] for item in results),
+            "clips": results,
+        }
+    )
+    training.base_pitch = base_pitch
+
+    try:
+        run_id = await asyncio.to_thread(
+            rvc.create_rvc_training_runpod,
+            str(store.root),
+            training.slug,
+            [training.training_data[item["index"]] for item in results],
+            training.item_webhook_url,
+        )
+    except Exception as e:
+        await training.fail(f"Voice training could not be started. {e}")
+        return
+
+    await training.set_status(
+        VoiceTrainingStatus.training,
+        run_id=run_id,
+        feature_store=str(store.root),
+        base_pitch=training.base_pitch,
+    )
+
+
+async def process_training_webhook(
+    training: VoiceTraining, data: VoiceTrainingWebhookData
+):
+    # only the first copy of a callback moves the training out of `training`
+    if data.error or not data.model_url:
+        if await training.transition(
+            VoiceTrainingStatus.training, VoiceTrainingStatus.error
+        ):
+            await training.fail(f"Voice training failed. {data.error}")
+        else:
+            logging.info(f"Webhook for training not in progress ignored {training.uid}")
+        return
+
+    if not await training.transition(
+        VoiceTrainingStatus.training,
+        VoiceTrainingStatus.completed,
+        model_url=data.model_url,
+    ):
+        logging.info(f"Webhook for training not in progress ignored {training.uid}")
+        return
+
+    try:
+        await VoiceModel.create_item(
+            {
+                "user_id": training.user_id,
+                "name": training.name,
+                "slug": training.slug,
+                "model_url": data.model_url,
+                "base_pitch": training.base_pitch or 0,
+                "category": training.category,
+                "gender": training.gender,
+                "sample_voice": training.training_data[0],
+            }
+        )
+    except DuplicateKeyError:
+        # another training took the slug after the check in train_voice
+        await training.fail("A voice model with this slug already exists.")
+        return
+
+    if training.webhook_url:
+        async with httpx.AsyncClient() as client:
+            await client.post(
+                training.webhook_url,
+                json=training.model_dump(
+                    mode="json", exclude=training.webhook_exclude_fields
+                ),
+            )
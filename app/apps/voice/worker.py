@@ -0,0 +1,26 @@
+from server import lifecycle
+from utils.tasks import release_tasks, resume_tasks
+
+from .models import VoiceTraining
+from .schemas import VoiceTrainingStatus
+
+
+def _unfinished_query() -> dict:
+    # past preprocessing the job runs on RunPod and reports by webhook
+    return {
+        "status": {
+            "$in": [VoiceTrainingStatus.init, VoiceTrainingStatus.preprocessing]
+        },
+        "is_deleted": False,
+    }
+
+
+@lifecycle.on_resume
+async def resume_voice_trainings():
+    """Start trainings left unfinished by another process over again."""
+    await resume_tasks(VoiceTraining, _unfinished_query())
+
+
+@lifecycle.on_drain
+async def release_voice_trainings():
+    await release_tasks(VoiceTraining, _unfinished_query())
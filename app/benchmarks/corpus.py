@@ -0,0 +1,111 @@
+"""
+Generate the synthetic audio corpus used by the benchmarks.
+
+    python -m benchmarks.corpus --seconds 5 30 300 3600 --formats wav flac ogg mp3
+
+Files are named `<kind>_<seconds>s.<format>` and generated from a fixed seed,
+so every machine gets the same corpus. Existing files are kept.
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import soundfile
+from scipy import signal
+
+KINDS = ("tone", "speech")
+FORMATS = {
+    "wav": ("WAV", "PCM_16"),
+    "flac": ("FLAC", "PCM_16"),
+    "ogg": ("OGG", "VORBIS"),
+    "mp3": ("MP3", "MPEG_LAYER_III"),
+}
+DEFAULT_SECONDS = (5, 30, 300, 3600)
+SAMPLE_RATE = 44100
+BLOCK_SECONDS = 10
+
+default_dir = Path(
+    os.getenv("NEDA_BENCH_CORPUS", default=Path(__file__).parent / ".corpus")
+)
+
+
+def tone_block(start: int, length: int, sr: int, rng) -> np.ndarray:
+    t = (start + np.arange(length)) / sr
+    return 0.3 * np.sin(2 * np.pi * 180 * t)
+
+
+def speech_block(start: int, length: int, sr: int, rng) -> np.ndarray:
+    """
+    A speech-like signal: a glottal pulse train with drifting pitch, shaped by
+    three formant resonators and a syllable-rate envelope with pauses.
+    """
+    t = (start + np.arange(length)) / sr
+    f0 = 140 + 40 * np.sin(2 * np.pi * 0.3 * t) + 8 * np.sin(2 * np.pi * 5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    source = signal.sawtooth(phase) + 0.05 * rng.standard_normal(length)
+
+    voiced = np.zeros(length)
+    for formant, bandwidth in ((700, 130), (1200, 70), (2600, 160)):
+        b, a = signal.iirpeak(formant, formant / bandwidth, fs=sr)
+        voiced += signal.lfilter(b, a, source)
+
+    envelope = np.clip(np.sin(2 * np.pi * 2 * t), 0, None) ** 0.5
+    envelope *= (t % 7) < 6  # a one second pause every seven seconds
+    return 0.3 * voiced * envelope / (np.abs(voiced).max() or 1)
+
+
+def write(path: Path, kind: str, seconds: float, sr: int = SAMPLE_RATE):
+    """Write block by block so an hour of audio does not sit in memory."""
+    generate = {"tone": tone_block, "speech": speech_block}[kind]
+    rng = np.random.default_rng([KINDS.index(kind), int(seconds)])
+    audio_format, subtype = FORMATS[path.suffix[1:]]
+    tmp_path = path.with_name(f".{path.name}")
+    total = int(seconds * sr)
+    with soundfile.SoundFile(
+        tmp_path, "w", sr, 1, subtype=subtype, format=audio_format
+    ) as out:
+        for start in range(0, total, BLOCK_SECONDS * sr):
+            length = min(BLOCK_SECONDS * sr, total - start)
+            out.write(generate(start, length, sr, rng).astype(np.float32))
+    os.replace(tmp_path, path)
+
+
+def ensure(
+    root: Path = default_dir,
+    seconds=DEFAULT_SECONDS,
+    formats=tuple(FORMATS),
+    kinds=KINDS,
+) -> list[Path]:
+    root.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for kind in kinds:
+        for length in seconds:
+            for audio_format in formats:
+                path = root / f"{kind}_{length}s.{audio_format}"
+                if not path.exists():
+                    write(path, kind, length)
+                paths.append(path)
+    return paths
+
+
+def describe(path: Path) -> dict:
+    kind, length = path.stem.split("_")
+    return {"kind": kind, "seconds": int(length[:-1]), "format": path.suffix[1:]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dir", type=Path, default=default_dir)
+    parser.add_argument("--seconds", type=int, nargs="+", default=DEFAULT_SECONDS)
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS))
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS))
+    args = parser.parse_args()
+
+    for path in ensure(args.dir, args.seconds, args.formats, args.kinds):
+        print(path, f"{path.stat().st_size / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
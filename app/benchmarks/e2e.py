@@ -0,0 +1,229 @@
+"""
+Measure the full conversion flow: `POST /voices`, the backend webhook and the
+task reaching `completed`, against a local mongod and `benchmarks.fakes`.
+
+    python -m benchmarks.e2e --jobs 50 --concurrency 10 --audio speech_30s.wav
+
+A throwaway mongod is started when `mongod` is on the PATH and no
+`--mongo-uri` is given. The API runs through `benchmarks.serve`, so the bearer
+token is simply a user uuid.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+import httpx
+
+from . import corpus
+
+base_path = "/v1/apps/neda"
+target_voice = "bench"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise TimeoutError(f"{process.args} did not listen on {port}")
+
+
+@contextmanager
+def background(args: list[str], port: int, env: dict | None = None):
+    process = subprocess.Popen(
+        args,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port, process)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+@contextmanager
+def local_mongod():
+    mongod = shutil.which("mongod")
+    if mongod is None:
+        raise RuntimeError("mongod is not on the PATH, pass --mongo-uri instead")
+    port = free_port()
+    with tempfile.TemporaryDirectory() as dbpath:
+        args = [mongod, "--dbpath", dbpath, "--port", str(port)]
+        with background([*args, "--bind_ip", "127.0.0.1", "--quiet"], port):
+            yield f"mongodb://127.0.0.1:{port}/neda_bench"
+
+
+@contextmanager
+def services(mongo_uri: str | None, inference_delay: float):
+    with ExitStack() as stack:
+        if mongo_uri is None:
+            mongo_uri = stack.enter_context(local_mongod())
+
+        fakes_port, api_port = free_port(), free_port()
+        fakes_url = f"http://127.0.0.1:{fakes_port}"
+        api_url = f"http://127.0.0.1:{api_port}"
+        stack.enter_context(
+            background(
+                [sys.executable, "-m", "uvicorn", "benchmarks.fakes:app"]
+                + ["--port", str(fakes_port)],
+                fakes_port,
+                {
+                    "FAKE_INFERENCE_DELAY": str(inference_delay),
+                    "FAKE_WEBHOOK_BASE": api_url,
+                },
+            )
+        )
+        stack.enter_context(
+            background(
+                [sys.executable, "-m", "benchmarks.serve"],
+                api_port,
+                {
+                    "PORT": str(api_port),
+                    "MONGO_URI": mongo_uri,
+                    "RUNPOD_BASE_URL": f"{fakes_url}/runpod",
+                    "RUNPOD_API_KEY": "bench",
+                    "RUNPOD_ID": "bench",
+                    "UFAAS_BASE_URL": f"{fakes_url}/ufaas",
+                    "UFILES_URL": f"{fakes_url}/ufiles",
+                    "USSO_URL": f"{fakes_url}/usso",
+                    "UFILES_API_KEY": "bench",
+                    "RATE_LIMIT_PER_MINUTE": "0",
+                    "MAX_CONCURRENT_CONVERSIONS": "0",
+                    "DAILY_MINUTES_BUDGET": "0",
+                    "PREWARM_AUDIO_URL": "",
+                },
+            )
+        )
+        yield api_url, fakes_url
+
+
+async def seed_model(client: httpx.AsyncClient, fakes_url: str):
+    response = await client.post(
+        f"{base_path}/models",
+        json={
+            "user_id": str(uuid.uuid4()),
+            "name": "Bench",
+            "slug": target_voice,
+            "model_url": f"{fakes_url}/models/bench.zip",
+            "base_pitch": 150,
+        },
+    )
+    # an existing model from an earlier run against the same database is fine
+    if response.status_code >= 400 and "duplicate" not in response.text.lower():
+        response.raise_for_status()
+
+
+async def convert(
+    client: httpx.AsyncClient, audio_url: str, poll: float, timeout: float
+) -> dict:
+    headers = {"Authorization": f"Bearer {uuid.uuid4()}"}
+    started_at = time.perf_counter()
+    response = await client.post(
+        f"{base_path}/voices",
+        json={"url": audio_url, "target_voice": target_voice},
+        headers=headers,
+    )
+    created = time.perf_counter() - started_at
+    if response.status_code != 201:
+        return {"create": created, "status": f"http_{response.status_code}"}
+
+    uid = response.json()["uid"]
+    while time.perf_counter() - started_at < timeout:
+        await asyncio.sleep(poll)
+        item = (await client.get(f"{base_path}/voices/{uid}", headers=headers)).json()
+        if item["task_status"] in ("completed", "error"):
+            return {
+                "create": created,
+                "total": time.perf_counter() - started_at,
+                "status": item["task_status"],
+            }
+    return {"create": created, "status": "timeout"}
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * q), len(values) - 1)], 3)
+
+
+async def run_flow(api_url: str, fakes_url: str, args) -> dict:
+    async with httpx.AsyncClient(base_url=api_url, timeout=60) as client:
+        await seed_model(client, fakes_url)
+        semaphore = asyncio.Semaphore(args.concurrency)
+        audio_url = f"{fakes_url}/corpus/{args.audio}"
+
+        async def job():
+            async with semaphore:
+                return await convert(client, audio_url, args.poll, args.timeout)
+
+        started_at = time.perf_counter()
+        results = await asyncio.gather(*[job() for _ in range(args.jobs)])
+        elapsed = time.perf_counter() - started_at
+
+    created = [item["create"] for item in results]
+    totals = [item["total"] for item in results if item["status"] == "completed"]
+    return {
+        "jobs": args.jobs,
+        "completed": len(totals),
+        "failed": args.jobs - len(totals),
+        "create_p50_seconds": percentile(created, 0.5),
+        "create_p95_seconds": percentile(created, 0.95),
+        "total_p50_seconds": percentile(totals, 0.5),
+        "total_p95_seconds": percentile(totals, 0.95),
+        "total_mean_seconds": round(statistics.mean(totals), 3) if totals else None,
+        "jobs_per_second": round(len(totals) / elapsed, 2),
+    }
+
+
+def run(args) -> dict:
+    corpus.ensure(seconds=[corpus.describe(corpus.default_dir / args.audio)["seconds"]])
+    with services(args.mongo_uri, args.inference_delay) as (api_url, fakes_url):
+        return asyncio.run(run_flow(api_url, fakes_url, args))
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--audio", default="speech_30s.wav")
+    parser.add_argument("--inference-delay", type=float, default=0.5)
+    parser.add_argument("--poll", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=300)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    print(json.dumps(run(parser.parse_args()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
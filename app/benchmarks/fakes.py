@@ -0,0 +1,145 @@
+"""
+Local stand-ins for the services the API calls, for load tests and benchmarks.
+
+    uvicorn benchmarks.fakes:app --port 9000
+
+Point the API at it with `RUNPOD_BASE_URL=http://localhost:9000/runpod` and use
+`http://localhost:9000/audio/<seconds>.wav` as the voice URL. Training jobs
+(those with a `dataset`) call back with a fake `model_url`. Files of the
+synthetic corpus are served under `/corpus/<name>`.
+
+`/ufaas`, `/ufiles` and `/usso` accept any call and answer with the request
+body plus ids and timestamps, which is enough for usage metering, uploads
+and API key token exchange.
+"""
+
+import asyncio
+import io
+import os
+import uuid
+import wave
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import fastapi
+import httpx
+import numpy as np
+
+from . import corpus
+
+app = fastapi.FastAPI(title="neda fakes")
+
+inference_delay = float(os.getenv("FAKE_INFERENCE_DELAY", default=0.5))
+# the API builds https webhook URLs on its public host, send them here instead
+webhook_base = os.getenv("FAKE_WEBHOOK_BASE")
+jobs: dict[str, dict] = {}
+
+
+def sine_wav(seconds: float, sr: int = 44100, freq: float = 180) -> bytes:
+    t = np.arange(int(seconds * sr)) / sr
+    samples = (0.3 * np.sin(2 * np.pi * freq * t) * 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sr)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+@app.get("/audio/{seconds}.wav")
+async def audio(seconds: float):
+    return fastapi.Response(sine_wav(seconds), media_type="audio/wav")
+
+
+async def complete_job(job_id: str, data: dict):
+    await asyncio.sleep(inference_delay)
+    if "dataset" in data:
+        result = {"model_url": f"https://fake/models/{job_id}.zip"}
+    else:
+        result = {"output_url": f"https://fake/output/{job_id}.wav"}
+    jobs[job_id].update(status="COMPLETED", output=result)
+    if webhook_url := data.get("webhook_url"):
+        if webhook_base:
+            parts = urlsplit(webhook_url)
+            webhook_url = webhook_base.rstrip("/") + parts.path
+            if parts.query:
+                webhook_url = f"{webhook_url}?{parts.query}"
+        async with httpx.AsyncClient() as client:
+            await client.post(webhook_url, json=result)
+
+
+@app.post("/runpod/{endpoint}/run")
+async def runpod_run(endpoint: str, data: dict = fastapi.Body(...)):
+    job_id = str(uuid.uuid4())
+    jobs[job_id] = {"endpoint": endpoint, "status": "IN_QUEUE"}
+    asyncio.create_task(complete_job(job_id, data["input"]))
+    return {"id": job_id, "status": "IN_QUEUE"}
+
+
+@app.get("/runpod/{endpoint}/status/{job_id}")
+async def runpod_status(endpoint: str, job_id: str):
+    return {"id": job_id, **jobs.get(job_id, {"status": "FAILED"})}
+
+
+@app.get("/runpod/{endpoint}/health")
+async def runpod_health(endpoint: str):
+    queued = sum(
+        1
+        for job in jobs.values()
+        if job["endpoint"] == endpoint and job["status"] != "COMPLETED"
+    )
+    return {
+        "jobs": {"inQueue": queued, "inProgress": 0},
+        "workers": {"idle": 1, "running": 1},
+    }
+
+
+@app.get("/corpus/{name}")
+async def corpus_file(name: str):
+    path = corpus.default_dir / name
+    if path.parent != corpus.default_dir or not path.exists():
+        raise fastapi.HTTPException(status_code=404)
+    return fastapi.responses.FileResponse(path)
+
+
+def echo(data: dict | None = None, **extra) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    uid = str(uuid.uuid4())
+    return {
+        "uid": uid,
+        "id": uid,
+        "created_at": now,
+        "updated_at": now,
+        "is_deleted": False,
+        "meta_data": {},
+        **(data or {}),
+        **extra,
+    }
+
+
+async def request_json(request: fastapi.Request) -> dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+@app.api_route("/ufaas/{path:path}", methods=["GET", "POST", "PATCH", "DELETE"])
+async def ufaas(path: str, request: fastapi.Request):
+    data = await request_json(request)
+    if "quota" in path:
+        return echo(data, quota=10**6)
+    return echo(data, status="active")
+
+
+@app.api_route("/ufiles/{path:path}", methods=["GET", "POST", "PATCH", "DELETE"])
+async def ufiles(path: str, request: fastapi.Request):
+    data = await request_json(request)
+    return echo(data, url=data.get("url") or f"{request.base_url}audio/5.wav")
+
+
+@app.api_route("/usso/{path:path}", methods=["GET", "POST"])
+async def usso(path: str):
+    return echo(access_token="fake", token_type="bearer", expires_in=3600)
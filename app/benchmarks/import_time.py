@@ -0,0 +1,85 @@
+"""
+Measure process start-up cost: import time of the API modules with and
+without the audio stack, and latency of the first analysis call with and
+without `voice.warmup()`.
+
+    python -m benchmarks.import_time --repeat 3
+
+Every measurement runs in a fresh interpreter, so caches from earlier runs in
+the same process do not hide the cost.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+IMPORT_SNIPPET = """
+import time
+started_at = time.perf_counter()
+import {module}
+print(time.perf_counter() - started_at)
+"""
+
+FIRST_CALL_SNIPPET = """
+import time
+from io import BytesIO
+import numpy as np
+import soundfile
+from utils import voice
+
+if {warmup}:
+    voice.warmup()
+
+wav_io = BytesIO()
+tone = np.sin(2 * np.pi * 180 * np.arange(5 * 44100) / 44100).astype(np.float32)
+soundfile.write(wav_io, tone, 44100, format="WAV")
+
+started_at = time.perf_counter()
+voice.get_duration(wav_io)
+voice.get_voice_pitch_parselmouth(wav_io)
+print(time.perf_counter() - started_at)
+"""
+
+
+def run(snippet: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", snippet], capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure(snippet: str, repeat: int) -> dict:
+    samples = [run(snippet) for _ in range(repeat)]
+    return {
+        "median_s": round(statistics.median(samples), 3),
+        "max_s": round(max(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--modules",
+        nargs="+",
+        default=["utils.rvc", "apps.neda.services", "utils.voice"],
+    )
+    args = parser.parse_args()
+
+    report = {
+        "import": {
+            module: measure(IMPORT_SNIPPET.format(module=module), args.repeat)
+            for module in args.modules
+        },
+        "first_call": {
+            "cold": measure(FIRST_CALL_SNIPPET.format(warmup=False), args.repeat),
+            "warm": measure(FIRST_CALL_SNIPPET.format(warmup=True), args.repeat),
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
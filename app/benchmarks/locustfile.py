@@ -0,0 +1,68 @@
+"""
+Load test for create, retrieve and webhook on /voices.
+
+Run the API against a local mongod and `benchmarks.fakes`, then:
+
+    NEDA_TOKEN=<jwt> locust -f benchmarks/locustfile.py --headless \
+        -u 50 -r 10 -t 1m --host http://localhost:8000
+
+The summary printed at exit has requests/s, p50 and p99 per endpoint.
+"""
+
+import json
+import os
+import random
+
+from locust import HttpUser, between, events, task
+
+base_path = os.getenv("NEDA_BASE_PATH", "/v1/apps/neda")
+fakes_url = os.getenv("FAKES_URL", "http://localhost:9000")
+target_voice = os.getenv("NEDA_TARGET_VOICE", "default")
+
+
+class VoiceUser(HttpUser):
+    wait_time = between(0.05, 0.2)
+
+    def on_start(self):
+        self.client.headers["Authorization"] = f"Bearer {os.getenv('NEDA_TOKEN')}"
+        self.uids: list[str] = []
+
+    @task(1)
+    def create(self):
+        response = self.client.post(
+            f"{base_path}/voices",
+            json={"url": f"{fakes_url}/audio/10.wav", "target_voice": target_voice},
+            name="create",
+        )
+        if response.ok:
+            self.uids.append(response.json()["uid"])
+
+    @task(5)
+    def retrieve(self):
+        if self.uids:
+            self.client.get(
+                f"{base_path}/voices/{random.choice(self.uids)}", name="retrieve"
+            )
+
+    @task(2)
+    def webhook(self):
+        if self.uids:
+            self.client.post(
+                f"{base_path}/voices/{random.choice(self.uids)}/webhook",
+                json={"output_url": f"{fakes_url}/audio/10.wav"},
+                name="webhook",
+            )
+
+
+@events.quitting.add_listener
+def summary(environment, **kwargs):
+    report = {
+        name: {
+            "requests_per_second": round(entry.total_rps, 1),
+            "p50_ms": entry.get_response_time_percentile(0.5),
+            "p99_ms": entry.get_response_time_percentile(0.99),
+            "failures": entry.num_failures,
+        }
+        for (name, _), entry in environment.stats.entries.items()
+    }
+    print(json.dumps(report, indent=2))
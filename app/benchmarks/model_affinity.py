@@ -0,0 +1,142 @@
+"""
+Simulate RVC jobs over fake backends with a model cold-start cost and compare
+routing with and without model affinity.
+
+    python -m benchmarks.model_affinity --jobs 5000 --endpoints 3 --workers 2
+
+Time is simulated, so the run takes seconds regardless of the job count.
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import random
+import statistics
+
+from apps.neda import backends
+from apps.neda.backends import BackendRouter, InferenceBackend
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeBackend(InferenceBackend):
+    """A serverless endpoint whose workers each keep the last loaded model."""
+
+    health_ttl = 0
+
+    def __init__(self, name, clock, workers, cold_start, inference, **kwargs):
+        super().__init__(name=name, cost_per_minute=0.5, max_queue=50, **kwargs)
+        self.clock = clock
+        self.workers = workers
+        self.cold_start = cold_start
+        self.inference = inference
+        self.worker_state = [{"free_at": 0.0, "model": None} for _ in range(workers)]
+        self.running: list[tuple[float, float]] = []  # (finish, latency)
+        self.cold_starts = 0
+
+    async def refresh(self):
+        self.queue_depth = sum(
+            1 for finish, _ in self.running if finish > self.clock.now
+        )
+
+    async def submit(self, audio, model_url, pitch, webhook_url):
+        now = self.clock.now
+        slug = model_url
+        worker = min(
+            self.worker_state,
+            key=lambda w: (
+                max(w["free_at"], now) + (w["model"] != slug) * self.cold_start
+            ),
+        )
+        start = max(worker["free_at"], now)
+        cold = worker["model"] != slug
+        self.cold_starts += cold
+        finish = (
+            start + cold * self.cold_start + self.inference * random.uniform(0.5, 1.5)
+        )
+        worker["free_at"] = finish
+        worker["model"] = slug
+        self.running.append((finish, finish - now))
+        return f"{self.name}:{len(self.running)}"
+
+
+async def simulate(args, affinity: bool) -> dict:
+    random.seed(args.seed)
+    clock = SimClock()
+    backends.time = clock
+    fakes = [
+        FakeBackend(
+            f"fake:{i}",
+            clock,
+            workers=args.workers,
+            cold_start=args.cold_start,
+            inference=args.inference,
+        )
+        for i in range(args.endpoints)
+    ]
+    router = BackendRouter(fakes)
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(args.models)]
+    pending: list[tuple[float, float, str]] = []
+
+    latencies = []
+    for _ in range(args.jobs):
+        clock.now += random.expovariate(args.rate)
+        while pending and pending[0][0] <= clock.now:
+            _, latency, name = heapq.heappop(pending)
+            router.get(name).record_success(latency)
+            latencies.append(latency)
+
+        slug = f"model-{random.choices(range(args.models), weights)[0]}"
+        backend, _ = await router.dispatch(
+            "audio", slug, 0, None, model_slug=slug if affinity else None
+        )
+        finish, latency = backend.running[-1]
+        heapq.heappush(pending, (finish, latency, backend.name))
+
+    latencies.extend(latency for _, latency, _ in pending)
+    latencies.sort()
+    return {
+        "mean_latency": round(statistics.mean(latencies), 2),
+        "p95_latency": round(latencies[int(len(latencies) * 0.95)], 2),
+        "cold_starts": sum(fake.cold_starts for fake in fakes),
+        "warm_hits": router.warm_hits,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--endpoints", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--models", type=int, default=20)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--rate", type=float, default=0.1, help="jobs per second")
+    parser.add_argument("--cold-start", type=float, default=20)
+    parser.add_argument("--inference", type=float, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    baseline = asyncio.run(simulate(args, affinity=False))
+    affinity = asyncio.run(simulate(args, affinity=True))
+    reduction = 1 - affinity["mean_latency"] / baseline["mean_latency"]
+    print(
+        json.dumps(
+            {
+                "baseline": baseline,
+                "affinity": affinity,
+                "mean_latency_reduction": round(reduction, 3),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compare resampling backends on long synthetic signals for speed and peak
+memory, in one shot and block by block.
+
+    python -m benchmarks.resample --minutes 10 --rates 44100 48000
+
+Peak memory is measured with tracemalloc, which sees numpy allocations but not
+buffers allocated inside soxr, so soxr figures only cover the Python side.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+from utils import voice
+
+
+def signal(minutes: float, sr: int) -> np.ndarray:
+    t = np.arange(int(minutes * 60 * sr), dtype=np.float32) / sr
+    return (0.3 * np.sin(2 * np.pi * 180 * t) + 0.01 * np.random.randn(len(t))).astype(
+        np.float32
+    )
+
+
+def measure(fn) -> dict:
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 3), "peak_mb": round(peak / 2**20, 1)}
+
+
+def streamed(y: np.ndarray, orig_sr: int, target_sr: int, backend: str, block: int):
+    resampler = voice.StreamResampler(orig_sr, target_sr, backend=backend)
+    samples = 0
+    for start in range(0, len(y), block):
+        samples += len(resampler.process(y[start : start + block]))
+    samples += len(resampler.flush())
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--rates", type=int, nargs="+", default=[44100, 48000])
+    parser.add_argument("--target", type=int, default=16000)
+    parser.add_argument("--block", type=int, default=1 << 16)
+    parser.add_argument(
+        "--backends", nargs="+", default=["soxr", "polyphase", "librosa"]
+    )
+    args = parser.parse_args()
+
+    report = {}
+    for orig_sr in args.rates:
+        y = signal(args.minutes, orig_sr)
+        # first calls import the backends and design the polyphase filter
+        for backend in args.backends:
+            voice.resample(y[:orig_sr], orig_sr, args.target, backend=backend)
+        results = {}
+        for backend in args.backends:
+            results[backend] = measure(
+                lambda: voice.resample(y, orig_sr, args.target, backend=backend)
+            )
+            if backend != "librosa":
+                results[f"{backend}_stream"] = measure(
+                    lambda: streamed(y, orig_sr, args.target, backend, args.block)
+                )
+        results["same_rate"] = measure(lambda: voice.resample(y, orig_sr, orig_sr))
+        report[f"{orig_sr}->{args.target}"] = results
+
+    print(json.dumps({"minutes": args.minutes, "results": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
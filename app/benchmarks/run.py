@@ -0,0 +1,104 @@
+"""
+Run the benchmark suite and compare it with a saved baseline.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --baseline bench.json --e2e
+
+Results are flattened to `<suite>.<case>.<metric>` keys. A metric regresses
+when it is worse than the baseline by more than its factor in
+`thresholds.json`; the command then exits with status 1.
+"""
+
+import argparse
+import fnmatch
+import json
+import sys
+from pathlib import Path
+
+from . import corpus, e2e, voice_functions
+
+thresholds_path = Path(__file__).parent / "thresholds.json"
+HIGHER_IS_BETTER = ("*_per_second", "*realtime_factor", "*.completed")
+
+
+def flatten(data: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in data.items():
+        key = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{key}."))
+        elif isinstance(value, (int, float)):
+            flat[key] = value
+    return flat
+
+
+def threshold(key: str, thresholds: dict) -> float:
+    for pattern, factor in thresholds["metrics"].items():
+        if fnmatch.fnmatch(key, pattern):
+            return factor
+    return thresholds["default"]
+
+
+def compare(results: dict, baseline: dict, thresholds: dict) -> list[dict]:
+    regressions = []
+    for key, value in results.items():
+        previous = baseline.get(key)
+        if previous is None or previous == 0:
+            continue
+        factor = threshold(key, thresholds)
+        if factor is None:
+            continue
+        if any(fnmatch.fnmatch(key, pattern) for pattern in HIGHER_IS_BETTER):
+            ratio = previous / value if value else float("inf")
+        else:
+            ratio = value / previous
+        if ratio > factor:
+            regressions.append(
+                {
+                    "metric": key,
+                    "baseline": previous,
+                    "value": value,
+                    "ratio": round(ratio, 2),
+                    "threshold": factor,
+                }
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--max-seconds", type=int, default=300)
+    parser.add_argument("--formats", nargs="+", default=list(corpus.FORMATS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--e2e", action="store_true", help="also run the API flow")
+    e2e.add_arguments(parser)
+    args = parser.parse_args()
+
+    seconds = [s for s in corpus.DEFAULT_SECONDS if s <= args.max_seconds]
+    suites = {
+        "voice": voice_functions.run(
+            seconds=seconds, formats=args.formats, repeat=args.repeat
+        )
+    }
+    if args.e2e:
+        suites["e2e"] = e2e.run(args)
+    results = flatten(suites)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+    report = {"results": results}
+    if args.baseline:
+        thresholds = json.loads(thresholds_path.read_text())
+        baseline = json.loads(args.baseline.read_text())
+        report["regressions"] = compare(results, baseline, thresholds)
+    print(json.dumps(report, indent=2))
+
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Run the API for the benchmarks with USSO replaced by a stand-in that trusts
+`Authorization: Bearer <user uuid>`, so no identity provider is needed.
+
+    MONGO_URI=mongodb://localhost:27018/neda_bench python -m benchmarks.serve
+"""
+
+import os
+import time
+import uuid
+
+import uvicorn
+from fastapi import Request
+
+from server.server import app
+
+
+class BenchUser:
+    def __init__(self, uid: uuid.UUID):
+        self.uid = uid
+        self.data = {"scopes": [], "exp": time.time() + 3600}
+
+
+def bench_user(request: Request) -> BenchUser:
+    token = request.headers.get("Authorization", "")[len("Bearer ") :]
+    return BenchUser(uuid.UUID(token))
+
+
+for route in app.routes:
+    router = getattr(getattr(route, "endpoint", None), "__self__", None)
+    if getattr(router, "user_dependency", None) is not None:
+        router.user_dependency = bench_user
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("PORT", default=8000)))
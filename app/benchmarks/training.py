@@ -0,0 +1,71 @@
+"""
+Measure training data preprocessing throughput against the number of worker
+processes, on synthetic clips written to a temporary feature store.
+
+    python -m benchmarks.training --clips 32 --seconds 20 --workers 1 2 4 8
+"""
+
+import argparse
+import json
+import multiprocessing
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import voice
+
+from .fakes import sine_wav
+
+
+def run(clips: list[bytes], workers: int) -> dict:
+    with tempfile.TemporaryDirectory() as store_dir:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            # pay the interpreter and import start-up outside the measurement
+            warm_clip = sine_wav(2)
+            list(
+                executor.map(
+                    voice.preprocess_clip,
+                    [warm_clip] * workers,
+                    range(workers),
+                    [f"{store_dir}/warmup"] * workers,
+                )
+            )
+            started_at = time.perf_counter()
+            results = list(
+                executor.map(
+                    voice.preprocess_clip,
+                    clips,
+                    range(len(clips)),
+                    [store_dir] * len(clips),
+                )
+            )
+            elapsed = time.perf_counter() - started_at
+
+    audio_seconds = sum(item["duration"] for item in results)
+    return {
+        "workers": workers,
+        "seconds": round(elapsed, 2),
+        "clips_per_second": round(len(clips) / elapsed, 2),
+        "audio_seconds_per_second": round(audio_seconds / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clips", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    clips = [sine_wav(args.seconds, freq=120 + 10 * (i % 8)) for i in range(args.clips)]
+    results = [run(clips, workers) for workers in args.workers]
+    baseline = results[0]["clips_per_second"]
+    for item in results:
+        item["speedup"] = round(item["clips_per_second"] / baseline, 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
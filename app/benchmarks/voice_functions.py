@@ -0,0 +1,84 @@
+"""
+Time the `utils.voice` building blocks on every file of the synthetic corpus.
+
+    python -m benchmarks.voice_functions --max-seconds 300
+
+`decode` is get_voice_array (decode, mono, resample to 16 kHz), `duration` is
+get_duration, `pitch` is the parselmouth f0 track of the decoded signal and
+`stats` is clean_pitch_values on that track. Each figure is the best of
+`--repeat` runs; peak memory of `decode` is measured with tracemalloc.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+from utils import voice
+
+from . import corpus
+
+
+def best_of(repeat: int, fn):
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings), result
+
+
+def measure_file(path: Path, repeat: int) -> dict:
+    content = path.read_bytes()
+    # long files are measured once, they dominate the run time anyway
+    repeat = repeat if corpus.describe(path)["seconds"] <= 60 else 1
+
+    decode, (y, sr) = best_of(repeat, lambda: voice.get_voice_array(BytesIO(content)))
+    duration, _ = best_of(repeat, lambda: voice.get_duration(BytesIO(content)))
+    pitch, f0 = best_of(repeat, lambda: voice.calculate_voice_pitch_parselmouth(y, sr))
+    stats, _ = best_of(repeat, lambda: voice.clean_pitch_values(f0))
+
+    tracemalloc.start()
+    voice.get_voice_array(BytesIO(content))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "decode_seconds": round(decode, 4),
+        "duration_seconds": round(duration, 5),
+        "pitch_seconds": round(pitch, 4),
+        "stats_seconds": round(stats, 5),
+        "decode_peak_mb": round(peak / 2**20, 1),
+        "realtime_factor": round(corpus.describe(path)["seconds"] / (decode + pitch)),
+    }
+
+
+def run(
+    root: Path = corpus.default_dir,
+    seconds=corpus.DEFAULT_SECONDS,
+    formats=tuple(corpus.FORMATS),
+    repeat: int = 3,
+) -> dict:
+    voice.warmup()
+    return {
+        path.name: measure_file(path, repeat)
+        for path in corpus.ensure(root, seconds, formats)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dir", type=Path, default=corpus.default_dir)
+    parser.add_argument("--max-seconds", type=int, default=max(corpus.DEFAULT_SECONDS))
+    parser.add_argument("--formats", nargs="+", default=list(corpus.FORMATS))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    seconds = [s for s in corpus.DEFAULT_SECONDS if s <= args.max_seconds]
+    print(json.dumps(run(args.dir, seconds, args.formats, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -28,3 +28,79 @@ class Settings(config.Settings):
     )
     minutes_price: float = 3  # coin per minute
     convert_voice_price: float = 2.25
+
+    rate_limit_per_minute: int = int(os.getenv("RATE_LIMIT_PER_MINUTE") or 20)
+    rate_limit_burst: int = int(os.getenv("RATE_LIMIT_BURST") or 5)
+    max_concurrent_conversions: int = int(os.getenv("MAX_CONCURRENT_CONVERSIONS") or 3)
+    daily_minutes_budget: float = float(os.getenv("DAILY_MINUTES_BUDGET") or 120)
+    # tenant-wide limits, 0 disables the check
+    tenant_rate_limit_per_minute: int = int(
+        os.getenv("TENANT_RATE_LIMIT_PER_MINUTE") or 0
+    )
+    tenant_max_concurrent_conversions: int = int(
+        os.getenv("TENANT_MAX_CONCURRENT_CONVERSIONS") or 0
+    )
+    tenant_daily_minutes_budget: float = float(
+        os.getenv("TENANT_DAILY_MINUTES_BUDGET") or 0
+    )
+
+    runpod_cost_per_minute: float = float(os.getenv("RUNPOD_COST_PER_MINUTE") or 0.5)
+    replicate_cost_per_minute: float = float(
+        os.getenv("REPLICATE_COST_PER_MINUTE") or 1.5
+    )
+    backend_max_queue: int = int(os.getenv("BACKEND_MAX_QUEUE") or 10)
+    backend_cooldown: float = 30  # seconds, doubled on consecutive failures
+    backend_failure_threshold: int = 2  # consecutive failures before cooling down
+    backend_default_latency: float = 60  # seconds
+    backend_cost_weight: float = 60  # seconds of latency worth one coin
+
+    model_warm_ttl: float = float(os.getenv("MODEL_WARM_TTL") or 300)
+    model_cold_start: float = float(os.getenv("MODEL_COLD_START") or 20)
+    prewarm_models: int = int(os.getenv("PREWARM_MODELS") or 5)
+    prewarm_audio_url: str | None = os.getenv("PREWARM_AUDIO_URL")
+    prewarm_interval: int = 240  # seconds
+    # only models requested within this many seconds are kept warm
+    prewarm_window: int = int(os.getenv("PREWARM_WINDOW") or 3600)
+
+    # import and warm up the audio stack before the server takes requests
+    audio_warmup: bool = os.getenv("AUDIO_WARMUP", default="").lower() in (
+        "1",
+        "true",
+    )
+
+    max_audio_size: int = int(os.getenv("MAX_AUDIO_SIZE") or 200 * 1024 * 1024)
+    max_audio_duration: float = float(os.getenv("MAX_AUDIO_DURATION") or 3600)
+    probe_timeout: float = 5  # seconds
+
+    media_attr_timeout: float = 20  # seconds, per remote lookup or ffprobe run
+    media_attr_ttl: int = 60 * 60 * 24
+    media_attr_concurrency: int = 8
+
+    feature_store_dir: Path = Path(
+        os.getenv("FEATURE_STORE_DIR") or base_dir / "features"
+    )
+    training_workers: int = int(os.getenv("TRAINING_WORKERS") or os.cpu_count() or 1)
+    training_slice_seconds: float = 3.0
+
+    # finished conversions older than this move to the archive collection
+    archive_after_days: int = int(os.getenv("ARCHIVE_AFTER_DAYS") or 30)
+    archive_batch_size: int = 500
+    archive_interval: int = 60 * 60  # seconds
+
+    # seconds to let background work finish on shutdown before cancelling it
+    drain_timeout: float = float(os.getenv("DRAIN_TIMEOUT") or 25)
+    # processes refresh a heartbeat, the unfinished tasks of one that missed
+    # it for `worker_timeout` seconds are taken over on start-up
+    heartbeat_interval: int = 30
+    worker_timeout: float = 120
+    # a task that was resumed this many times is failed instead
+    max_resume_attempts: int = int(os.getenv("MAX_RESUME_ATTEMPTS") or 3)
+    # a dispatched task not updated for this long had its webhook lost
+    resume_stale_after: float = 300
+    # poll the backend for results when the webhook is this late
+    webhook_grace: float = float(os.getenv("WEBHOOK_GRACE") or 600)
+
+    # profile this percentage of conversions, admins can ask with X-Profile
+    profile_sample_percent: float = float(os.getenv("PROFILE_SAMPLE_PERCENT") or 0)
+    profile_interval: float = 0.005  # seconds between stack samples
+    profile_dir: Path = Path(os.getenv("PROFILE_DIR") or base_dir / "profiles")
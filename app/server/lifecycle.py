@@ -0,0 +1,151 @@
+"""In-flight work tracking, graceful drain on shutdown and resume on startup."""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+from fastapi import FastAPI
+from fastapi_mongo_base.core import exceptions
+
+from .config import Settings
+
+# marks the work this process owns, so replicas do not resume each other's
+instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+tasks: set[asyncio.Task] = set()
+draining = False
+resume_hooks: list[Callable[[], Awaitable]] = []
+drain_hooks: list[Callable[[], Awaitable]] = []
+
+
+def spawn(coro: Awaitable) -> asyncio.Task:
+    """
+    Run `coro` in the background and keep track of it, so shutdown can wait
+    for it. Use instead of `BackgroundTasks` for work that outlives a request.
+    """
+    task = asyncio.create_task(coro)
+    tasks.add(task)
+    task.add_done_callback(_done)
+    return task
+
+
+def _done(task: asyncio.Task):
+    tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logging.error(f"Background task failed {task.exception()!r}")
+
+
+def begin_drain():
+    global draining
+    if not draining:
+        logging.info(f"Draining, {len(tasks)} background tasks in flight")
+    draining = True
+
+
+def ensure_accepting():
+    if draining:
+        raise exceptions.BaseHTTPException(
+            status_code=503,
+            error="service_unavailable",
+            message={
+                "en": "The service is restarting. Please try again shortly.",
+                "fa": "سرویس در حال راه‌اندازی مجدد است. لطفا کمی بعد تلاش کنید.",
+            },
+        )
+
+
+async def drain(timeout: float):
+    """
+    Wait up to `timeout` seconds for background tasks, then cancel the rest
+    and run the drain hooks, which hand unfinished work back for `resume`.
+    Every stage persists its progress when it finishes, so a cancelled task
+    continues from its last completed stage.
+    """
+    begin_drain()
+    if tasks:
+        done, pending = await asyncio.wait(set(tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending, timeout=1)
+        logging.info(f"Drained {len(done)} background tasks, cancelled {len(pending)}")
+    await _run_hooks(drain_hooks)
+
+
+def on_resume(hook: Callable[[], Awaitable]):
+    resume_hooks.append(hook)
+    return hook
+
+
+def on_drain(hook: Callable[[], Awaitable]):
+    drain_hooks.append(hook)
+    return hook
+
+
+async def resume():
+    await _run_hooks(resume_hooks)
+
+
+async def _run_hooks(hooks: list[Callable[[], Awaitable]]):
+    for hook in hooks:
+        try:
+            await hook()
+        except Exception as e:
+            logging.error(f"Lifecycle hook failed {hook.__name__} {e!r}")
+
+
+async def warmup_audio():
+    """Import and exercise the audio stack off the event loop."""
+
+    def warmup():
+        from utils import voice
+
+        voice.warmup()
+
+    started_at = time.perf_counter()
+    await asyncio.to_thread(warmup)
+    logging.info(f"Audio stack warmed up in {time.perf_counter() - started_at:.2f}s")
+
+
+def _install_signal_handlers():
+    """
+    Start draining as soon as SIGTERM arrives, while the server still waits
+    for open requests, then hand over to the server's own handler.
+    """
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            begin_drain()
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+def install(app: FastAPI):
+    """
+    Wrap the app lifespan: warm up and resume after start-up, so the server
+    only takes requests once that is done, and drain before shutdown.
+    """
+    lifespan_context = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        async with lifespan_context(app) as state:
+            _install_signal_handlers()
+            if Settings.audio_warmup:
+                await warmup_audio()
+            await resume()
+            try:
+                yield state
+            finally:
+                await drain(Settings.drain_timeout)
+
+    app.router.lifespan_context = lifespan
@@ -2,8 +2,9 @@ from apps.neda.routes import router as neda_router
 from apps.voice.routes import router as voice_router
 from fastapi_mongo_base.core import app_factory
 
-from . import config, worker
+from . import config, lifecycle, worker
 
 app = app_factory.create_app(settings=config.Settings(), worker=worker.worker)
 app.include_router(neda_router, prefix=f"{config.Settings.base_path}")
 app.include_router(voice_router, prefix=f"{config.Settings.base_path}")
+lifecycle.install(app)
@@ -1,9 +1,12 @@
 import asyncio
 import logging
 
-from apps.neda.worker import check_open_voice_convert_status
+from apps.neda.history import archive_finished_tasks
+from apps.neda.worker import prewarm_popular_models, update_voice_convert
+from apps.voice import worker as voice_worker  # noqa: F401, lifecycle hooks
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from server.config import Settings
+from utils.tasks import heartbeat
 
 # import pytz
 # irst_timezone = pytz.timezone("Asia/Tehran")
@@ -12,8 +15,15 @@ logging.getLogger("apscheduler").setLevel(logging.WARNING)
 
 async def worker():
     scheduler = AsyncIOScheduler()
+    scheduler.add_job(heartbeat, "interval", seconds=Settings.heartbeat_interval)
     scheduler.add_job(
-        check_open_voice_convert_status, "interval", seconds=Settings.worker_update_time
+        update_voice_convert, "interval", seconds=Settings.worker_update_time
+    )
+    scheduler.add_job(
+        prewarm_popular_models, "interval", seconds=Settings.prewarm_interval
+    )
+    scheduler.add_job(
+        archive_finished_tasks, "interval", seconds=Settings.archive_interval
     )
 
     scheduler.start()
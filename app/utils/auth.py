@@ -0,0 +1,43 @@
+import time
+from typing import Awaitable, Callable
+
+import fastapi
+
+max_cached_tokens = 10_000
+_users: dict[str, tuple[object, float]] = {}
+
+
+def get_token(request: fastapi.Request) -> str | None:
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return request.cookies.get("usso_access_token")
+
+
+async def cached_user(
+    request: fastapi.Request,
+    resolver: Callable[[fastapi.Request], Awaitable[object]],
+):
+    """
+    Resolve the request user once per token and reuse it until the token's
+    `exp` claim, so repeated calls skip the JWT verification.
+    """
+    token = get_token(request)
+    if not token:
+        return await resolver(request)
+
+    now = time.time()
+    cached = _users.get(token)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    user = await resolver(request)
+    expires_at = (getattr(user, "data", None) or {}).get("exp")
+    if expires_at and expires_at > now:
+        if len(_users) >= max_cached_tokens:
+            for key in [key for key, (_, exp) in _users.items() if exp <= now]:
+                del _users[key]
+            if len(_users) >= max_cached_tokens:
+                _users.clear()
+        _users[token] = (user, expires_at)
+    return user
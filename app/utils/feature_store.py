@@ -0,0 +1,45 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+class FeatureStore:
+    """
+    A dataset directory of `<kind>_<index>.npy` shards plus a JSON manifest.
+    Shards are written atomically and read back memory-mapped, so the training
+    stage can stream features larger than memory.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def shard_path(self, kind: str, index: int) -> Path:
+        return self.root / f"{kind}_{index:05d}.npy"
+
+    def write(self, kind: str, index: int, array: np.ndarray) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.shard_path(kind, index)
+        tmp_path = path.with_suffix(".tmp.npy")
+        np.save(tmp_path, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+        return path
+
+    def read(self, kind: str, index: int) -> np.ndarray:
+        return np.load(self.shard_path(kind, index), mmap_mode="r")
+
+    def shards(self, kind: str) -> list[np.ndarray]:
+        return [
+            np.load(path, mmap_mode="r")
+            for path in sorted(self.root.glob(f"{kind}_[0-9]*.npy"))
+        ]
+
+    def write_manifest(self, manifest: dict):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / "manifest.json.tmp"
+        tmp_path.write_text(json.dumps(manifest, default=str))
+        os.replace(tmp_path, self.root / "manifest.json")
+
+    def read_manifest(self) -> dict:
+        return json.loads((self.root / "manifest.json").read_text())
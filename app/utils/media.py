@@ -1,9 +1,14 @@
 import json
 import uuid
 
+import httpx
 import ufiles
+from aiocache import cached
+from pydantic import BaseModel
 from server.config import Settings
 
+PROBE_BYTES = 4096
+
 
 async def upload_file(
     file_url: str,
@@ -25,3 +30,136 @@ async def upload_file(
         meta_data=meta_data,
     )
     return ufile_item.url
+
+
+class ProbeResult(BaseModel):
+    url: str
+    ok: bool
+    reason: str | None = None
+    content_type: str | None = None
+    size: int | None = None
+    format: str | None = None
+    duration: float | None = None
+    # network failures are not cached, the next request probes again
+    retryable: bool = False
+
+
+AUDIO_SIGNATURES = (
+    (0, b"RIFF", "wav"),
+    (0, b"ID3", "mp3"),
+    (0, b"OggS", "ogg"),
+    (0, b"fLaC", "flac"),
+    (0, b"\x1aE\xdf\xa3", "webm"),
+    (0, b"#!AMR", "amr"),
+    (4, b"ftyp", "mp4"),
+    (0, b"FORM", "aiff"),
+    (0, b"caff", "caf"),
+    # ASF header object GUID, used by wma
+    (0, b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", "wma"),
+)
+REJECTED_CONTENT_TYPES = ("text/", "image/", "application/json", "application/xml")
+
+
+def sniff_format(head: bytes) -> str | None:
+    for offset, signature, audio_format in AUDIO_SIGNATURES:
+        if head[offset : offset + len(signature)] == signature:
+            return audio_format
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # MPEG audio frame sync, raw mp3 or ADTS aac
+        return "mp3"
+    return None
+
+
+def wav_duration(head: bytes) -> float | None:
+    """Duration from the WAV header, if the fmt and data chunks are in `head`."""
+    if head[8:12] != b"WAVE":
+        return None
+    byte_rate = None
+    position = 12
+    while position + 8 <= len(head):
+        chunk_id = head[position : position + 4]
+        chunk_size = int.from_bytes(head[position + 4 : position + 8], "little")
+        if chunk_id == b"fmt " and position + 20 <= len(head):
+            byte_rate = int.from_bytes(head[position + 16 : position + 20], "little")
+        elif chunk_id == b"data" and byte_rate:
+            return chunk_size / byte_rate
+        position += 8 + chunk_size + chunk_size % 2
+    return None
+
+
+def _total_size(response: httpx.Response) -> int | None:
+    content_range = response.headers.get("content-range", "")
+    try:
+        if "/" in content_range and not content_range.endswith("*"):
+            return int(content_range.rsplit("/", 1)[1])
+        if response.status_code == 200 and "content-length" in response.headers:
+            return int(response.headers["content-length"])
+    except ValueError:
+        # a malformed header, the streamed download enforces the limit instead
+        pass
+    return None
+
+
+@cached(ttl=60 * 10, skip_cache_func=lambda result: result.retryable)
+async def probe_url(url: str) -> ProbeResult:
+    """
+    Check a submitted URL before anything downloads it: one ranged GET reads
+    the headers and the first bytes, which is enough for the content type,
+    size, format and, for WAV, the duration.
+    """
+    try:
+        async with httpx.AsyncClient(
+            follow_redirects=True, timeout=Settings.probe_timeout
+        ) as client:
+            async with client.stream(
+                "GET", url, headers={"Range": f"bytes=0-{PROBE_BYTES - 1}"}
+            ) as response:
+                if response.status_code >= 400:
+                    return ProbeResult(
+                        url=url,
+                        ok=False,
+                        reason=f"URL returned HTTP {response.status_code}.",
+                        retryable=response.status_code >= 500,
+                    )
+                head = b""
+                async for chunk in response.aiter_bytes():
+                    head += chunk
+                    if len(head) >= PROBE_BYTES:
+                        break
+    except (httpx.InvalidURL, httpx.UnsupportedProtocol) as e:
+        # a malformed URL will never work, no point in asking to retry
+        return ProbeResult(url=url, ok=False, reason=f"Invalid URL. {e}")
+    except httpx.HTTPError as e:
+        return ProbeResult(
+            url=url, ok=False, reason=f"URL is not reachable. {e}", retryable=True
+        )
+
+    content_type = response.headers.get("content-type", "").split(";")[0].strip()
+    result = ProbeResult(
+        url=url,
+        ok=False,
+        content_type=content_type,
+        size=_total_size(response),
+        format=sniff_format(head),
+    )
+    if content_type.startswith(REJECTED_CONTENT_TYPES):
+        result.reason = f"URL does not point to audio ({content_type})."
+    elif result.size and result.size > Settings.max_audio_size:
+        result.reason = (
+            f"File is too large ({result.size} bytes, "
+            f"limit {Settings.max_audio_size})."
+        )
+    elif result.format is None and not content_type.startswith("audio/"):
+        # trust the server for audio formats without a known signature
+        result.reason = "Unsupported or unrecognized audio format."
+    else:
+        if result.format == "wav":
+            result.duration = wav_duration(head)
+        if result.duration and result.duration > Settings.max_audio_duration:
+            result.reason = (
+                f"Audio is too long ({result.duration:.0f}s, "
+                f"limit {Settings.max_audio_duration}s)."
+            )
+        else:
+            result.ok = True
+    return result
@@ -0,0 +1,200 @@
+"""
+Opt-in per-job profiling: wall and CPU time plus peak memory per stage, the
+sizes of the large arrays a job allocates, and a sampling profiler whose
+stacks are written in the folded format read by flamegraph.pl and speedscope.
+
+Everything here is a no-op unless a job is being profiled, so the hooks can
+stay in the hot paths. Settings are imported lazily to keep `utils.voice`
+importable in bare worker processes.
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+current: ContextVar["JobProfile | None"] = ContextVar("profile", default=None)
+# tracemalloc is process wide, it runs while any profiled job does
+_jobs = 0
+_owns_tracemalloc = False
+
+
+def sampled() -> bool:
+    from server.config import Settings
+
+    return random.random() * 100 < Settings.profile_sample_percent
+
+
+def rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+class StackSampler(threading.Thread):
+    """
+    Sample the stack of one thread every `interval` seconds and count the
+    folded stacks, prefixed with the job stage running at that moment.
+    """
+
+    def __init__(self, profile: "JobProfile", thread_id: int, interval: float):
+        super().__init__(name=f"profiler-{profile.name}", daemon=True)
+        self.profile = profile
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.peak_rss_mb: float | None = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+                frame = frame.f_back
+            names.append(self.profile.stage_name or "idle")
+            self.stacks[";".join(reversed(names))] += 1
+
+            rss = rss_mb()
+            if rss is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb or 0, rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join(timeout=1)
+
+
+class JobProfile:
+    def __init__(self, name: str):
+        self.name = name
+        self.stage_name: str | None = None
+        self.stages: dict[str, dict] = {}
+        self.arrays: list[dict] = []
+        self.sampler: StackSampler | None = None
+
+    def start(self):
+        from server.config import Settings
+
+        global _jobs, _owns_tracemalloc
+        if _jobs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _owns_tracemalloc = True
+        _jobs += 1
+        self.sampler = StackSampler(
+            self, threading.get_ident(), Settings.profile_interval
+        )
+        self.sampler.start()
+
+    def stop(self):
+        global _jobs, _owns_tracemalloc
+        self.sampler.stop()
+        _jobs -= 1
+        if _jobs == 0 and _owns_tracemalloc:
+            tracemalloc.stop()
+            _owns_tracemalloc = False
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a stage. CPU time and the tracemalloc peak are process wide, so
+        work of concurrent jobs on the same event loop is included.
+        """
+        parent, self.stage_name = self.stage_name, name
+        tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            stage = self.stages.setdefault(
+                name, {"wall": 0.0, "cpu": 0.0, "peak_mb": 0.0}
+            )
+            stage["wall"] += time.perf_counter() - wall
+            stage["cpu"] += time.process_time() - cpu
+            stage["peak_mb"] = max(stage["peak_mb"], peak / 2**20)
+            self.stage_name = parent
+
+    def record_array(self, where: str, array):
+        self.arrays.append(
+            {
+                "where": where,
+                "stage": self.stage_name,
+                "shape": list(getattr(array, "shape", ())),
+                "dtype": str(getattr(array, "dtype", type(array).__name__)),
+                "mb": round(getattr(array, "nbytes", len(array)) / 2**20, 3),
+            }
+        )
+
+    def summary(self) -> dict:
+        return {
+            "stages": {
+                name: {key: round(value, 4) for key, value in stage.items()}
+                for name, stage in self.stages.items()
+            },
+            "arrays": sorted(self.arrays, key=lambda item: -item["mb"])[:20],
+            "peak_rss_mb": self.sampler.peak_rss_mb and round(self.sampler.peak_rss_mb),
+            "samples": sum(self.sampler.stacks.values()),
+        }
+
+    def dump(self, directory: Path) -> Path:
+        directory.mkdir(parents=True, exist_ok=True)
+        folded = directory / f"{self.name}.folded"
+        folded.write_text(
+            "".join(
+                f"{stack} {count}\n" for stack, count in self.sampler.stacks.items()
+            )
+        )
+        (directory / f"{self.name}.json").write_text(
+            json.dumps(self.summary(), indent=2)
+        )
+        return folded
+
+
+@contextmanager
+def profile_job(name: str):
+    """Profile everything run in this context until it exits."""
+    from server.config import Settings
+
+    profile = JobProfile(name)
+    profile.start()
+    token = current.set(profile)
+    try:
+        yield profile
+    finally:
+        current.reset(token)
+        profile.stop()
+        try:
+            profile.dump(Settings.profile_dir)
+        except OSError as e:
+            logging.warning(f"Profile dump failed {name} {e}")
+
+
+@contextmanager
+def stage(name: str):
+    profile = current.get()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+
+def record_array(where: str, array):
+    profile = current.get()
+    if profile is not None:
+        profile.record_array(where, array)
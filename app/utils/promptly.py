@@ -1,12 +1,36 @@
+import asyncio
+import hashlib
+import json
 import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 
 import httpx
+from beanie.odm.operators.update.general import Set
 from fastapi_mongo_base.utils import basic
+from pymongo.errors import DuplicateKeyError
 
 
 class PromptlyClient(httpx.AsyncClient):
+    # shared by all clients in the process, clients are short lived
+    memory_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+    in_flight: dict[str, asyncio.Future] = {}
+    metrics = {
+        "hits": 0,
+        "persistent_hits": 0,
+        "misses": 0,
+        "coalesced": 0,
+        "bypassed": 0,
+    }
 
-    def __init__(self):
+    max_entries = 1024
+    default_ttl = 60 * 60
+    # ttl per endpoint key, e.g. {"image/describe": 24 * 60 * 60}
+    ttls: dict[str, int] = {}
+
+    def __init__(self, persistent: bool = False):
+        """`persistent` adds the Mongo `promptly_cache` collection as a second tier."""
         super().__init__(
             base_url=os.getenv("PROMPTLY_URL"),
             headers={
@@ -15,13 +39,111 @@ class PromptlyClient(httpx.AsyncClient):
                 "x-api-key": os.getenv("UFILES_API_KEY"),
             },
         )
+        self.persistent = persistent
+
+    @staticmethod
+    def cache_key(endpoint: str, payload: dict) -> str:
+        canonical = json.dumps(
+            payload, sort_keys=True, separators=(",", ":"), default=str
+        )
+        return hashlib.sha256(f"{endpoint}\n{canonical}".encode()).hexdigest()
+
+    def _memory_get(self, key: str):
+        item = self.memory_cache.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.time():
+            del self.memory_cache[key]
+            return None
+        self.memory_cache.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value, ttl: int):
+        expires_at = time.time() + ttl
+        self.memory_cache[key] = (expires_at, value)
+        self.memory_cache.move_to_end(key)
+        while len(self.memory_cache) > self.max_entries:
+            self.memory_cache.popitem(last=False)
+
+    async def _persistent_get(self, key: str):
+        # the document model lives with the app models, so it is registered
+        # with beanie at start-up
+        from apps.neda.models import PromptlyCacheEntry
+
+        entry = await PromptlyCacheEntry.find_one(
+            {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+        )
+        if entry is None:
+            return None
+        remaining = entry.expires_at.replace(tzinfo=timezone.utc) - datetime.now(
+            timezone.utc
+        )
+        self._memory_set(key, entry.value, int(remaining.total_seconds()))
+        return entry.value
+
+    async def _persistent_set(self, key: str, value, ttl: int):
+        from apps.neda.models import PromptlyCacheEntry
+
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        try:
+            await PromptlyCacheEntry.find_one({"key": key}).upsert(
+                Set({"value": value, "expires_at": expires_at}),
+                on_insert=PromptlyCacheEntry(
+                    key=key, value=value, expires_at=expires_at
+                ),
+            )
+        except DuplicateKeyError:
+            # another process cached the same response at the same time
+            pass
+
+    async def _cached(self, endpoint: str, payload: dict, call, **kwargs):
+        """
+        Serve `call()` from the cache, sharing one in-flight call between
+        concurrent identical requests. `cache=False` skips the cache and
+        `ttl` overrides the per-endpoint ttl.
+        """
+        if not kwargs.get("cache", True):
+            self.metrics["bypassed"] += 1
+            return await call()
+
+        key = self.cache_key(endpoint, payload)
+        if (value := self._memory_get(key)) is not None:
+            self.metrics["hits"] += 1
+            return value
+        if key in self.in_flight:
+            self.metrics["coalesced"] += 1
+            return await asyncio.shield(self.in_flight[key])
+        if self.persistent and (value := await self._persistent_get(key)) is not None:
+            self.metrics["persistent_hits"] += 1
+            return value
+
+        self.metrics["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            value = await call()
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self.in_flight.pop(key, None)
+
+        if value is not None:
+            ttl = kwargs.get("ttl") or self.ttls.get(endpoint, self.default_ttl)
+            self._memory_set(key, value, ttl)
+            if self.persistent:
+                await self._persistent_set(key, value, ttl)
+        return value
 
     @basic.try_except_wrapper
     @basic.retry_execution(attempts=3, delay=1)
-    async def ai_image(
+    async def _ai_image(
         self, image_url: str, key: str, data: dict = {}, **kwargs
     ) -> dict:
-        timeout = httpx.Timeout(kwargs.get("timeout", 30), read=None, connect=None)
+        timeout = httpx.Timeout(kwargs.pop("timeout", 30), read=None, connect=None)
         r = await self.post(
             f"/image/{key}",
             json={**data, "image_url": image_url},
@@ -33,12 +155,55 @@ class PromptlyClient(httpx.AsyncClient):
 
     @basic.try_except_wrapper
     @basic.retry_execution(attempts=3, delay=1)
-    async def ai(self, key: str, data: dict = {}, **kwargs) -> dict:
-        timeout = httpx.Timeout(kwargs.get("timeout", 30), read=None, connect=None)
+    async def _ai(self, key: str, data: dict = {}, **kwargs) -> dict:
+        timeout = httpx.Timeout(kwargs.pop("timeout", 30), read=None, connect=None)
         r = await self.post(f"/{key}", json=data, timeout=timeout, **kwargs)
         r.raise_for_status()
         return r.json()
 
+    async def ai_image(
+        self,
+        image_url: str,
+        key: str,
+        data: dict = {},
+        cache: bool = True,
+        ttl: int | None = None,
+        **kwargs,
+    ) -> dict:
+        return await self._cached(
+            f"image/{key}",
+            {**data, "image_url": image_url},
+            lambda: self._ai_image(image_url, key, data, **kwargs),
+            cache=cache,
+            ttl=ttl,
+        )
+
+    async def ai(
+        self,
+        key: str,
+        data: dict = {},
+        cache: bool = True,
+        ttl: int | None = None,
+        **kwargs,
+    ) -> dict:
+        return await self._cached(
+            key,
+            data,
+            lambda: self._ai(key, data, **kwargs),
+            cache=cache,
+            ttl=ttl,
+        )
+
     async def ai_search(self, key: str, data: dict = {}, **kwargs) -> dict:
-        timeout = httpx.Timeout(kwargs.get("timeout", 30), read=None, connect=None)
-        return await self.ai(f"/search/{key}", data, timeout=timeout, **kwargs)
+        return await self.ai(f"search/{key}", data, **kwargs)
+
+    @classmethod
+    def cache_metrics(cls) -> dict:
+        lookups = sum(cls.metrics.values()) - cls.metrics["bypassed"]
+        return {
+            **cls.metrics,
+            "size": len(cls.memory_cache),
+            "hit_rate": (
+                round((lookups - cls.metrics["misses"]) / lookups, 3) if lookups else 0
+            ),
+        }
@@ -0,0 +1,116 @@
+import os
+
+
+def create_rvc_conversion(
+    audio: str,
+    model_url: str,
+    pitch: float = 0,
+    webhook_url: str = None,
+):
+    import replicate
+
+    input = {
+        "protect": 0.5,
+        "rvc_model": "CUSTOM",  # to use custom = CUSTOM
+        "index_rate": 0.5,
+        "input_audio": audio,
+        "pitch_change": pitch,
+        "rms_mix_rate": 0.3,
+        "filter_radius": 3,
+        "custom_rvc_model_download_url": model_url,
+        "output_format": "wav",
+    }
+
+    rep = replicate.predictions.create(
+        version="d18e2e0a6a6d3af183cc09622cebba8555ec9a9e66983261fc64c8b1572b7dce",
+        input=input,
+        webhook=webhook_url,
+        webhook_events_filter=["completed"],
+    )
+
+    return rep.id
+
+
+def _runpod_client(runpod_id: str | None = None):
+    import httpx
+
+    api_key = os.getenv("RUNPOD_API_KEY")
+    runpod_id = runpod_id or os.getenv("RUNPOD_ID")
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+
+    base_url = (
+        f"{os.getenv('RUNPOD_BASE_URL') or 'https://api.runpod.ai/v2'}/{runpod_id}"
+    )
+    return httpx.Client(base_url=base_url, headers=headers)
+
+
+def create_rvc_conversion_runpod(
+    audio: str,
+    model_url: str,
+    pitch: float = 0,
+    webhook_url: str = None,
+    runpod_id: str = None,
+):
+    data = {
+        "input": {
+            "protect": 0.5,
+            "rvc_model": "CUSTOM",
+            "index_rate": 0.5,
+            "input_audio": audio,
+            "pitch_change": pitch,
+            "rms_mix_rate": 0.3,
+            "filter_radius": 3,
+            "output_format": "wav",
+            "custom_rvc_model_download_url": model_url,
+            "webhook_url": webhook_url,
+        }
+    }
+
+    with _runpod_client(runpod_id) as client:
+        response = client.post("/run", json=data)
+        response.raise_for_status()
+        return response.json().get("id")
+
+
+def get_rvc_conversion_runpod_status(job_id: str, runpod_id: str = None):
+    with _runpod_client(runpod_id) as client:
+        response = client.get(f"/status/{job_id}")
+        return response.json()
+
+
+def get_runpod_health(runpod_id: str = None, timeout: float = 5):
+    """Queue and worker counts of a RunPod endpoint, as returned by `/health`."""
+    with _runpod_client(runpod_id) as client:
+        response = client.get("/health", timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def create_rvc_training_runpod(
+    dataset: str,
+    name: str,
+    clips: list[str],
+    webhook_url: str = None,
+    runpod_id: str = None,
+):
+    """
+    Submit the GPU training stage. `dataset` is the preprocessed feature store
+    directory, which the training endpoint reads from the shared volume.
+    """
+    data = {
+        "input": {
+            "name": name,
+            "dataset": dataset,
+            "training_data": clips,
+            "webhook_url": webhook_url,
+        }
+    }
+
+    with _runpod_client(runpod_id or os.getenv("RUNPOD_TRAIN_ID")) as client:
+        response = client.post("/run", json=data)
+        response.raise_for_status()
+        return response.json().get("id")
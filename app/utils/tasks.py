@@ -0,0 +1,148 @@
+"""
+Task state shared by the conversion and training documents, and claiming of
+unfinished tasks between processes.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+from beanie.odm.operators.update.array import Push
+from beanie.odm.operators.update.general import Inc, Set
+from fastapi_mongo_base.models import BaseEntity
+from fastapi_mongo_base.tasks import TaskLogRecord
+from pymongo import ASCENDING, IndexModel
+from server import lifecycle
+from server.config import Settings
+
+
+class TaskStateMixin:
+    """
+    Status updates for task documents whose `_status` setter derives
+    `task_status` and `task_progress`. Put it before the schema in the bases.
+    """
+
+    def _status_fields(self) -> dict:
+        return {
+            "status": self.status,
+            "task_status": self.task_status,
+            "task_progress": self.task_progress,
+        }
+
+    async def update_fields(self, *operators, **fields):
+        """
+        Persist only the given fields (and any extra update operators) with a
+        single atomic update instead of saving the whole document.
+        """
+        fields["updated_at"] = datetime.now(timezone.utc)
+        await self.update(Set(fields), *operators)
+
+    async def set_status(self, status, **fields):
+        self._status = status
+        await self.update_fields(**self._status_fields(), **fields)
+
+    async def transition(self, current, status, **fields) -> bool:
+        """
+        `set_status`, but only if the stored status is still `current`, so
+        of two racing callers only one moves the task on.
+        """
+        self._status = status
+        fields = {
+            **self._status_fields(),
+            **fields,
+            "updated_at": datetime.now(timezone.utc),
+        }
+        result = (
+            await type(self)
+            .find_one({"uid": self.uid, "status": current})
+            .update(Set(fields))
+        )
+        return bool(result and result.modified_count)
+
+    async def record_failure(self, reason: str, **fields):
+        self._status = "error"
+        log = TaskLogRecord(
+            task_status=self.task_status, message=reason, log_type="error"
+        )
+        await self.update_fields(
+            Push({"task_logs": log}),
+            **self._status_fields(),
+            task_report=reason,
+            **fields,
+        )
+
+    async def fail(self, reason: str):
+        await self.record_failure(reason)
+        await self.emit_signals(self)
+
+
+class WorkerHeartbeat(BaseEntity):
+    instance_id: str
+    seen_at: datetime
+
+    class Settings:
+        name = "worker_heartbeats"
+        indexes = [
+            IndexModel([("instance_id", ASCENDING)], unique=True),
+            IndexModel([("seen_at", ASCENDING)], expireAfterSeconds=24 * 3600),
+        ]
+
+
+@lifecycle.on_resume
+async def heartbeat():
+    """Mark this process alive, so other processes leave its tasks alone."""
+    now = datetime.now(timezone.utc)
+    await WorkerHeartbeat.find_one({"instance_id": lifecycle.instance_id}).upsert(
+        Set({"seen_at": now}),
+        on_insert=WorkerHeartbeat(instance_id=lifecycle.instance_id, seen_at=now),
+    )
+
+
+@lifecycle.on_drain
+async def stop_heartbeat():
+    await WorkerHeartbeat.find({"instance_id": lifecycle.instance_id}).delete()
+
+
+async def live_workers() -> list[str]:
+    since = datetime.now(timezone.utc) - timedelta(seconds=Settings.worker_timeout)
+    workers = await WorkerHeartbeat.find({"seen_at": {"$gte": since}}).to_list()
+    return [worker.instance_id for worker in workers]
+
+
+async def resume_tasks(model, unfinished: dict) -> int:
+    """
+    Take over tasks matching `unfinished` that were handed back by a draining
+    process, or whose process stopped sending heartbeats, and start them
+    again. A task that keeps getting interrupted is failed instead.
+    """
+    # unset worker ids are not in the list either
+    claimable = {**unfinished, "worker_id": {"$nin": await live_workers()}}
+    resumed = 0
+    for task in await model.find(claimable).to_list():
+        result = await model.find_one({"uid": task.uid, **claimable}).update(
+            Set(
+                {
+                    "worker_id": lifecycle.instance_id,
+                    "updated_at": datetime.now(timezone.utc),
+                }
+            ),
+            Inc({"attempts": 1}),
+        )
+        if not result.modified_count:
+            continue
+        if task.attempts + 1 > Settings.max_resume_attempts:
+            lifecycle.spawn(
+                task.fail(f"Interrupted {task.attempts + 1} times, giving up.")
+            )
+            continue
+        lifecycle.spawn(task.start_processing())
+        resumed += 1
+    if resumed:
+        logging.info(f"Resumed {resumed} {model.__name__} tasks")
+    return resumed
+
+
+async def release_tasks(model, unfinished: dict):
+    """Hand unfinished tasks of this process back for another to resume."""
+    await model.find({**unfinished, "worker_id": lifecycle.instance_id}).update(
+        Set({"worker_id": None})
+    )
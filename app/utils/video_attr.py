@@ -1,23 +1,155 @@
+import asyncio
+import hashlib
+import json
 import logging
+import subprocess
+from io import BytesIO
 
 import httpx
+from aiocache import Cache
 from server.config import Settings
 
+cache = Cache(Cache.MEMORY, namespace="media_attributes")
 
-async def get_attributes(file_res: str):
-    ufiles_app = Settings.UFILES_BASE_URL.rstrip("/f")
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{ufiles_app}/apps/ffmpeg/details",
-            headers={"x-api-key": Settings.UFILES_API_KEY},
-            json={"url": file_res},
-            timeout=None,
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _soundfile_attributes(content: bytes) -> dict | None:
+    import soundfile
+
+    try:
+        info = soundfile.info(BytesIO(content))
+    except Exception:
+        return None
+    return {
+        "duration": info.duration,
+        "sample_rate": info.samplerate,
+        "channels": info.channels,
+        "format": info.format.lower(),
+    }
+
+
+def _ffprobe_attributes(content: bytes) -> dict | None:
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                *("-v", "error", "-of", "json"),
+                *("-show_format", "-show_streams", "-i", "pipe:0"),
+            ],
+            input=content,
+            capture_output=True,
+            timeout=Settings.media_attr_timeout,
+            check=True,
         )
-        if response.status_code != 200:
-            logging.error(
-                f"get_attributes failed {response.text=}, {response.status_code=}"
+        probe = json.loads(result.stdout)
+    except (OSError, subprocess.SubprocessError, json.JSONDecodeError) as e:
+        logging.warning(f"ffprobe failed {e}")
+        return None
+
+    data = {"duration": float(probe.get("format", {}).get("duration") or 0) or None}
+    for stream in probe.get("streams", []):
+        if stream.get("codec_type") == "video" and "width" not in data:
+            data.update(width=stream.get("width"), height=stream.get("height"))
+        elif stream.get("codec_type") == "audio" and "sample_rate" not in data:
+            data.update(
+                sample_rate=int(stream.get("sample_rate") or 0) or None,
+                channels=stream.get("channels"),
             )
-            data = {"url": file_res, "duration": 5, "width": 512, "height": 512}
-        else:
-            data = response.json()
+    return data if data["duration"] else None
+
+
+def local_attributes(content: bytes) -> dict | None:
+    """Read attributes from bytes already in memory, header first."""
+    return _soundfile_attributes(content) or _ffprobe_attributes(content)
+
+
+async def remote_attributes(file_res: str) -> dict | None:
+    ufiles_app = Settings.UFILES_BASE_URL.rstrip("/f")
+    try:
+        # httpx times each phase, a trickling response needs an overall deadline
+        async with asyncio.timeout(Settings.media_attr_timeout):
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{ufiles_app}/apps/ffmpeg/details",
+                    headers={"x-api-key": Settings.UFILES_API_KEY},
+                    json={"url": file_res},
+                    timeout=Settings.media_attr_timeout,
+                )
+    except (httpx.HTTPError, TimeoutError) as e:
+        logging.error(f"get_attributes failed {file_res=} {e!r}")
+        return None
+
+    if response.status_code != 200:
+        logging.error(
+            f"get_attributes failed {response.text=}, {response.status_code=}"
+        )
+        return None
+    return response.json()
+
+
+async def get_attributes(
+    file_res: str, content: bytes | BytesIO | None = None
+) -> dict | None:
+    """
+    Duration and dimensions of a media file. Uses the downloaded bytes when
+    given, otherwise the remote ffmpeg app; results are cached by URL and by
+    content hash. Returns None when the attributes cannot be determined.
+    """
+    if data := await cache.get(file_res):
+        return data
+
+    if isinstance(content, BytesIO):
+        content = content.getvalue()
+
+    data = None
+    if content:
+        digest = content_hash(content)
+        data = await cache.get(digest)
+        if data is None:
+            data = await asyncio.to_thread(local_attributes, content)
+            if data:
+                await cache.set(digest, data, ttl=Settings.media_attr_ttl)
+
+    if data is None:
+        data = await remote_attributes(file_res)
+
+    if data is None:
+        return None
+
+    data = {**data, "url": file_res}
+    await cache.set(file_res, data, ttl=Settings.media_attr_ttl)
     return data
+
+
+async def get_attributes_batch(
+    files: list[str], contents: dict[str, bytes | BytesIO] | None = None
+) -> dict[str, dict | None]:
+    """
+    Attributes for many files at once: duplicates are looked up once, calls
+    run concurrently up to a limit and the whole batch shares one deadline.
+    """
+    contents = contents or {}
+    semaphore = asyncio.Semaphore(Settings.media_attr_concurrency)
+
+    async def lookup(file_res: str):
+        async with semaphore:
+            return await get_attributes(file_res, contents.get(file_res))
+
+    unique = list(dict.fromkeys(files))
+    tasks = [asyncio.create_task(lookup(file_res)) for file_res in unique]
+    rounds = -(-len(unique) // Settings.media_attr_concurrency) or 1
+    done, pending = await asyncio.wait(
+        tasks, timeout=Settings.media_attr_timeout * rounds
+    )
+    for task in pending:
+        task.cancel()
+    if pending:
+        logging.error(f"get_attributes_batch timed out for {len(pending)} files")
+
+    return {
+        file_res: task.result() if task in done and not task.exception() else None
+        for file_res, task in zip(unique, tasks)
+    }
@@ -1,12 +1,14 @@
+import functools
+import math
 import os
 from io import BytesIO
 
-import librosa
 import numpy as np
 import parselmouth
 import soundfile
 from pydub import AudioSegment
-from fastapi_mongo_base.utils import texttools
+
+from utils import profiling
 
 
 def calculate_voice_pitch_parselmouth(audio: np.ndarray, sr: int) -> np.ndarray:
@@ -24,6 +26,8 @@ def calculate_voice_pitch_parselmouth(audio: np.ndarray, sr: int) -> np.ndarray:
 def clean_pitch_values(pitch_values: np.ndarray) -> np.ndarray:
     # Remove NaNs
     valid_pitch = pitch_values[~np.isnan(pitch_values)]
+    profiling.record_array("clean_pitch_values.input", pitch_values)
+    profiling.record_array("clean_pitch_values.valid", valid_pitch)
 
     if len(valid_pitch) == 0:
         return pitch_values  # all NaN, nothing to do
@@ -69,6 +73,148 @@ def calculate_voice_pitch_crepe(audio: np.ndarray, sr: int) -> np.ndarray:
     return freqs
 
 
+RESAMPLE_BACKENDS = ("soxr", "polyphase", "librosa")
+resample_backend = os.getenv("RESAMPLE_BACKEND") or "auto"
+
+
+@functools.cache
+def _available_backend(backend: str | None = None) -> str:
+    backend = backend or resample_backend
+    if backend != "auto":
+        if backend not in RESAMPLE_BACKENDS:
+            raise ValueError(f"Unknown resample backend {backend}")
+        return backend
+    for candidate, module in (("soxr", "soxr"), ("polyphase", "scipy.signal")):
+        try:
+            __import__(module)
+            return candidate
+        except ImportError:
+            continue
+    return "librosa"
+
+
+@functools.lru_cache(maxsize=32)
+def polyphase_filter(orig_sr: int, target_sr: int) -> tuple[int, int, np.ndarray]:
+    """
+    The `up`/`down` factors and the low-pass FIR that
+    `scipy.signal.resample_poly` would design, computed once per rate pair.
+    """
+    from scipy.signal import firwin
+
+    gcd = math.gcd(int(orig_sr), int(target_sr))
+    up, down = int(target_sr) // gcd, int(orig_sr) // gcd
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    h.setflags(write=False)
+    return up, down, h
+
+
+def resample(
+    y: np.ndarray, orig_sr: int, target_sr: int, backend: str | None = None
+) -> np.ndarray:
+    """Resample a mono signal, doing nothing when the rates already match."""
+    if orig_sr == target_sr:
+        return y
+
+    backend = _available_backend(backend)
+    if backend == "soxr":
+        import soxr
+
+        return soxr.resample(y, orig_sr, target_sr, quality="HQ")
+    if backend == "polyphase":
+        from scipy.signal import resample_poly
+
+        up, down, h = polyphase_filter(orig_sr, target_sr)
+        return resample_poly(y, up, down, window=h).astype(y.dtype, copy=False)
+
+    import librosa
+
+    return librosa.resample(y, orig_sr=orig_sr, target_sr=target_sr)
+
+
+class StreamResampler:
+    """
+    Resample a stream block by block with the filter state carried between
+    blocks, so long inputs never have to be held in memory at once. librosa
+    has no streaming mode, so it is served by the polyphase backend.
+    """
+
+    chunk = 4096  # output samples computed per vectorized step
+
+    def __init__(self, orig_sr: int, target_sr: int, backend: str | None = None):
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.backend = _available_backend(backend)
+        if orig_sr == target_sr:
+            self.backend = "passthrough"
+        elif self.backend == "soxr":
+            import soxr
+
+            self._stream = soxr.ResampleStream(
+                orig_sr, target_sr, 1, dtype="float32", quality="HQ"
+            )
+        else:
+            self.backend = "polyphase"
+            self._init_polyphase()
+
+    def _init_polyphase(self):
+        self.up, self.down, h = polyphase_filter(self.orig_sr, self.target_sr)
+        self.half_len = (len(h) - 1) // 2
+        self.taps = -(-len(h) // self.up)
+        padded = np.zeros(self.taps * self.up, dtype=np.float32)
+        padded[: len(h)] = h * self.up
+        # phases[p, j] = h[p + j * up]: the taps applied to one output phase
+        self.phases = padded.reshape(self.taps, self.up).T.copy()
+        self.buffer = np.zeros(self.taps - 1, dtype=np.float32)
+        self.buffer_start = -(self.taps - 1)
+        self.n_in = 0
+        self.n_out = 0
+
+    def process(self, block: np.ndarray, last: bool = False) -> np.ndarray:
+        block = np.asarray(block, dtype=np.float32)
+        if self.backend == "passthrough":
+            return block
+        if self.backend == "soxr":
+            return self._stream.resample_chunk(block, last=last)
+
+        self.buffer = np.concatenate([self.buffer, block])
+        self.n_in += len(block)
+        if last:
+            end = -(-self.n_in * self.up // self.down)
+            pad = self.taps + self.half_len // self.up + 1
+            self.buffer = np.concatenate([self.buffer, np.zeros(pad, np.float32)])
+        else:
+            # output m needs inputs up to (m * down + half_len) // up
+            end = (self.n_in * self.up - 1 - self.half_len) // self.down + 1
+        end = max(end, self.n_out)
+
+        output = self._compute(self.n_out, end)
+        self.n_out = end
+
+        first_needed = (end * self.down + self.half_len) // self.up - (self.taps - 1)
+        drop = min(first_needed - self.buffer_start, len(self.buffer))
+        if drop > 0:
+            self.buffer = self.buffer[drop:]
+            self.buffer_start += drop
+        return output
+
+    def flush(self) -> np.ndarray:
+        return self.process(np.zeros(0, dtype=np.float32), last=True)
+
+    def _compute(self, start: int, end: int) -> np.ndarray:
+        output = np.empty(end - start, dtype=np.float32)
+        taps = np.arange(self.taps)
+        for offset in range(start, end, self.chunk):
+            m = np.arange(offset, min(offset + self.chunk, end))
+            t = m * self.down + self.half_len
+            index = (t // self.up - self.buffer_start)[:, None] - taps
+            output[offset - start : offset - start + len(m)] = np.einsum(
+                "ij,ij->i", self.phases[t % self.up], self.buffer[index]
+            )
+        return output
+
+
 def get_voice_array(audio_bytes: BytesIO) -> np.ndarray:
     audio_bytes.seek(0)
     try:
@@ -83,6 +229,7 @@ def get_voice_array(audio_bytes: BytesIO) -> np.ndarray:
         audio_segment.export(wav_io, format="wav")
         wav_io.seek(0)
         y, sr = soundfile.read(wav_io)
+    profiling.record_array("get_voice_array.decoded", y)
 
     if len(y.shape) > 1:
         y = np.mean(y, axis=1)
@@ -90,9 +237,9 @@ def get_voice_array(audio_bytes: BytesIO) -> np.ndarray:
     y = y.astype(np.float32)
 
     # Resample to 16kHz for crepe
-    if sr != 16000:
-        y = librosa.resample(y, orig_sr=sr, target_sr=16000)
-        sr = 16000
+    y = resample(y, sr, 16000)
+    sr = 16000
+    profiling.record_array("get_voice_array.resampled", y)
 
     return y, sr
 
@@ -156,16 +303,16 @@ def calculate_pitch_shift_log(source_pitch: float, target_pitch_log: float) -> f
 
 
 def get_duration(audio: BytesIO):
+    audio.seek(0)
     try:
-        # First try with librosa
-        y, sr = librosa.load(audio)
-        duration_seconds = librosa.get_duration(y=y, sr=sr)
-        return duration_seconds
+        # First try the header with soundfile, nothing is decoded or resampled
+        return soundfile.info(audio).duration
     except Exception as e:
-        # If librosa fails, try with pydub
+        # If soundfile fails, try with pydub
         audio.seek(0)
         try:
             audio_segment = AudioSegment.from_file(audio)
+            profiling.record_array("get_duration.decoded", audio_segment.raw_data)
             return len(audio_segment) / 1000.0  # Convert milliseconds to seconds
         except Exception as e2:
             # If both methods fail, log the error and return a default duration
@@ -175,86 +322,88 @@ def get_duration(audio: BytesIO):
             return 60.0  # Default to 1 minute if we can't determine duration
 
 
-def create_rvc_conversion(
-    audio: str,
-    model_url: str,
-    pitch: float = 0,
-    webhook_url: str = None,
-):
-    import replicate
-
-    input = {
-        "protect": 0.5,
-        "rvc_model": "CUSTOM",  # to use custom = CUSTOM
-        "index_rate": 0.5,
-        "input_audio": audio,
-        "pitch_change": pitch,
-        "rms_mix_rate": 0.3,
-        "filter_radius": 3,
-        "custom_rvc_model_download_url": model_url,
-        "output_format": "wav",
-    }
-
-    rep = replicate.predictions.create(
-        version="d18e2e0a6a6d3af183cc09622cebba8555ec9a9e66983261fc64c8b1572b7dce",
-        input=input,
-        webhook=webhook_url,
-        webhook_events_filter=["completed"],
-    )
+def trim_silence(y: np.ndarray, top_db: float = 40) -> np.ndarray:
+    import librosa
 
-    return rep.id
+    trimmed, _ = librosa.effects.trim(y, top_db=top_db)
+    return trimmed
 
 
-def create_rvc_conversion_runpod(
-    audio: str,
-    model_url: str,
-    pitch: float = 0,
-    webhook_url: str = None,
-):
-    import httpx
-
-    api_key = os.getenv("RUNPOD_API_KEY")
-    runpod_id = os.getenv("RUNPOD_ID")
+def slice_audio(
+    y: np.ndarray, sr: int, seconds: float = 3.0, overlap: float = 0.3
+) -> np.ndarray:
+    """
+    Cut `y` into fixed-length, overlapping slices. The last slice is zero
+    padded; a tail shorter than one second is dropped.
+    """
+    length = int(seconds * sr)
+    hop = max(int(length * (1 - overlap)), 1)
+    starts = [
+        start
+        for start in range(0, max(len(y) - sr, 0) + 1, hop)
+        if len(y) - start >= sr
+    ]
+    slices = np.zeros((len(starts), length), dtype=np.float32)
+    for row, start in enumerate(starts):
+        chunk = y[start : start + length]
+        slices[row, : len(chunk)] = chunk
+    return slices
+
+
+def log_mel(slices: np.ndarray, sr: int, n_mels: int = 80) -> np.ndarray:
+    import librosa
+
+    mel = librosa.feature.melspectrogram(
+        y=slices, sr=sr, n_fft=1024, hop_length=sr // 100, n_mels=n_mels
+    )
+    return np.log(mel + 1e-5).astype(np.float32)
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
 
-    base_url = f"https://api.runpod.ai/v2/{runpod_id}"
-
-    data = {
-        "input": {
-            "protect": 0.5,
-            "rvc_model": "CUSTOM",
-            "index_rate": 0.5,
-            "input_audio": audio,
-            "pitch_change": pitch,
-            "rms_mix_rate": 0.3,
-            "filter_radius": 3,
-            "output_format": "wav",
-            "custom_rvc_model_download_url": model_url,
-            "webhook_url": webhook_url,
-        }
-    }
+def preprocess_clip(
+    content: bytes, index: int, store_dir: str, slice_seconds: float = 3.0
+) -> dict:
+    """
+    Decode, resample, trim, slice and extract pitch and log-mel features of
+    one training clip into the feature store. Runs in a worker process.
+    """
+    from utils.feature_store import FeatureStore
 
-    with httpx.Client(headers=headers) as client:
-        response = client.post(f"{base_url}/run", json=data)
-        return response.json().get("id")
+    y, sr = get_voice_array(BytesIO(content))
+    duration = len(y) / sr
+    slices = slice_audio(trim_silence(y), sr, slice_seconds)
+    if not len(slices):
+        return {"index": index, "duration": duration, "slices": 0}
 
+    f0 = np.stack([calculate_voice_pitch_parselmouth(item, sr) for item in slices])
+    store = FeatureStore(store_dir)
+    store.write("audio", index, slices)
+    store.write("f0", index, f0.astype(np.float32))
+    store.write("mel", index, log_mel(slices, sr))
 
-def get_rvc_conversion_runpod_status(job_id: str):
-    import httpx
+    voiced = f0[~np.isnan(f0)]
+    return {
+        "index": index,
+        "duration": duration,
+        "slices": len(slices),
+        "voiced_frames": int(voiced.size),
+        "log2_pitch_sum": float(np.log2(voiced).sum()),
+    }
 
-    api_key = os.getenv("RUNPOD_API_KEY")
-    runpod_id = os.getenv("RUNPOD_ID")
 
-    base_url = f"https://api.runpod.ai/v2/{runpod_id}"
+def warmup():
+    """
+    Run the decode, resample and pitch paths once on a generated clip, so the
+    first real job does not pay for lazy imports and JIT compilation.
+    """
+    sr = 44100
+    t = np.arange(sr) / sr
+    tone = (0.3 * np.sin(2 * np.pi * 180 * t)).astype(np.float32)
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
+    for orig_sr in (44100, 48000, 22050):
+        wav_io = BytesIO()
+        soundfile.write(wav_io, tone, orig_sr, format="WAV")
+        wav_io.seek(0)
+        get_duration(wav_io)
+        y, target_sr = get_voice_array(wav_io)
 
-    response = httpx.get(f"{base_url}/status/{job_id}")
-    return response.json()
+    clean_pitch_values(calculate_voice_pitch_parselmouth(y, target_sr))